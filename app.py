@@ -5,12 +5,15 @@ from flask import Flask, request
 from flask_cors import CORS
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from werkzeug.serving import run_simple
-from watchdog.observers import Observer
 
 from config import Config
 from controller.routes import routes
 import helper
-from graph_management import get_graph, VocviewFileSystemEventHandler
+import graph_management
+import http_cache
+import metrics
+import profiler
+import response_cache
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -27,22 +30,39 @@ application = DispatcherMiddleware(
 )
 
 
-# Set up python-watchdog
-path = 'data'
-observer = Observer()
-observer.schedule(VocviewFileSystemEventHandler(), path)
-observer.start()
+# Load the graph in the background and reload it when the data changes. Requests only ever read published graph
+# versions.
+graph_management.reloader.request_reload()
 
 
 @app.before_request
 def before():
-    # Config.g = Triplestore.get_db(Config.triplestore_type)
-    Config.g = get_graph(Config)
+    metrics.start_request()
+    # Pin the graph version for the whole request so a reload never swaps the graph out halfway through a page.
+    version = graph_management.pin_version(Config.graph_load_timeout)
+    if Config.graph_trace != 'off':
+        graph_management.start_trace()
+    if profiler.start():
+        # A profiled request is always rendered.
+        return None
+    return http_cache.not_modified(version) or response_cache.cached_response(version)
 
 
 @app.after_request
 def after(response):
-    return response
+    version = graph_management.current_version()
+    response = profiler.finish(response, version)
+    response = response_cache.store(response, version)
+    response = http_cache.add_validators(response, version)
+    trace = graph_management.current_trace()
+    if trace is not None:
+        response = trace.report(response)
+    return metrics.observe_request(response, version)
+
+
+@app.teardown_request
+def teardown(exception):
+    graph_management.unpin_version()
 
 
 @app.before_first_request
@@ -52,11 +72,6 @@ def init():
     logging.info('Loaded config:')
     logging.info(Config.__dict__)
 
-    logging.info('Triggering background task from vocview app.')
-    import worker  # Import to create directories if missing.
-    from tasks import fetch_data
-    fetch_data.s().apply_async()
-
 
 @app.context_processor
 def context_processor():
@@ -66,7 +81,7 @@ def context_processor():
 @atexit.register
 def shutdown():
     logger.info('Performing cleanup')
-    observer.stop()
+    graph_management.stop_watching()
 
 
 if __name__ == '__main__':
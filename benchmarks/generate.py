@@ -0,0 +1,153 @@
+"""
+Generate a synthetic SKOS vocabulary as Turtle.
+
+Each concept scheme holds a tree of concepts with a number of top concepts, each concept having up to --branching
+narrower concepts: --branching 1 makes long chains (deep hierarchies), a large --branching makes wide ones. Concepts
+have labels, alternative labels, notations, definitions and dates. A fraction of them is deprecated or mapped to a
+concept of another scheme with a reified mapping statement. Collections group random concepts.
+
+The data contains both directions of broader/narrower and topConceptOf/hasTopConcept, and labels for the predicates
+and classes used, so it can be loaded without running a reasoner or dereferencing anything.
+
+Usage (from the repository root):
+    python -m benchmarks.generate out.ttl [--concepts N] [--schemes N] [--branching N] [--top-concepts N] ...
+"""
+import argparse
+import random
+
+BASE = 'http://example.org/vocab/'
+
+PREFIXES = '''@prefix dcterms: <http://purl.org/dc/terms/> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+@prefix : <{}> .
+
+'''.format(BASE)
+
+# Labels of the predicates and classes used, as the SKOS ontology loaded by the harvest would provide.
+TERMS = [
+    ('skos:Concept', 'Concept'), ('skos:ConceptScheme', 'Concept Scheme'), ('skos:Collection', 'Collection'),
+    ('skos:prefLabel', 'preferred label'), ('skos:altLabel', 'alternative label'), ('skos:notation', 'notation'),
+    ('skos:definition', 'definition'), ('skos:inScheme', 'is in scheme'), ('skos:broader', 'has broader'),
+    ('skos:narrower', 'has narrower'), ('skos:topConceptOf', 'is top concept in scheme'),
+    ('skos:hasTopConcept', 'has top concept'), ('skos:member', 'has member'), ('skos:exactMatch', 'has exact match'),
+    ('skos:closeMatch', 'has close match'), ('dcterms:created', 'date created'), ('dcterms:modified', 'date modified'),
+    ('dcterms:description', 'description'), ('owl:deprecated', 'deprecated'), ('rdf:Statement', 'Statement'),
+    ('rdf:subject', 'subject'), ('rdf:predicate', 'predicate'), ('rdf:object', 'object'), ('rdf:type', 'type'),
+]
+
+WORDS = ('soil', 'water', 'vegetation', 'landform', 'structural', 'formation', 'cover', 'height', 'density',
+         'surface', 'texture', 'colour', 'drainage', 'slope', 'aspect', 'rock', 'outcrop', 'litter', 'canopy', 'tree',
+         'shrub', 'grass', 'fern', 'moss', 'lichen', 'sample', 'plot', 'site', 'method', 'protocol', 'observation')
+
+
+def _literal(text):
+    return '"{}"'.format(text.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def generate(f, concepts=10000, schemes=1, branching=10, top_concepts=10, alt_labels=2, mapping_ratio=0.05,
+             deprecated_ratio=0.02, collections=2, collection_size=100, seed=0):
+    """Write a vocabulary to the text file f."""
+    rng = random.Random(seed)
+    f.write(PREFIXES)
+    for term, label in TERMS:
+        f.write(f'{term} rdfs:label {_literal(label)}@en .\n')
+
+    per_scheme = max(concepts // schemes, 1)
+    concept_uris = []
+    for s in range(schemes):
+        scheme = f':scheme{s}'
+        first = s * per_scheme
+        last = concepts if s == schemes - 1 else first + per_scheme
+        top = min(top_concepts, last - first)
+        f.write(f'\n{scheme} a skos:ConceptScheme ;\n'
+                f'    skos:prefLabel {_literal(f"Scheme {s} {_words(rng, 2)}")}@en ;\n'
+                f'    dcterms:description {_literal(_words(rng, 20))}@en ;\n'
+                f'    dcterms:created "2020-01-01"^^xsd:date .\n')
+
+        for i in range(first, last):
+            concept = f':c{i}'
+            concept_uris.append(concept)
+            lines = [
+                f'{concept} a skos:Concept',
+                f'skos:prefLabel {_literal(f"{_words(rng, 2).capitalize()} {i}")}@en',
+                f'skos:notation "{s}.{i - first}"',
+                f'skos:definition {_literal(f"Definition of concept {i}: {_words(rng, 12)}")}@en',
+                f'skos:inScheme {scheme}',
+                'dcterms:created "2020-01-01"^^xsd:date',
+                'dcterms:modified "2021-06-30"^^xsd:date',
+            ]
+            lines += [f'skos:altLabel {_literal(_words(rng, 2))}@en' for _ in range(alt_labels)]
+
+            position = i - first
+            if position < top:
+                lines += [f'skos:topConceptOf {scheme}']
+                f.write(f'{scheme} skos:hasTopConcept {concept} .\n')
+            else:
+                # Breadth-first tree: the children of each concept are numbered consecutively.
+                parent = f':c{first + (position - top) // branching}'
+                lines += [f'skos:broader {parent}']
+                f.write(f'{parent} skos:narrower {concept} .\n')
+
+            if rng.random() < deprecated_ratio:
+                lines += ['owl:deprecated true']
+
+            if schemes > 1 and rng.random() < mapping_ratio:
+                other = rng.choice([o for o in range(schemes) if o != s])
+                target = f':c{other * per_scheme + rng.randrange(per_scheme)}'
+                predicate = rng.choice(('skos:exactMatch', 'skos:closeMatch'))
+                lines += [f'{predicate} {target}']
+                f.write(f':mapping{i} a rdf:Statement ; rdf:subject {concept} ; rdf:predicate {predicate} ; '
+                        f'rdf:object {target} ; dcterms:created "2021-01-01"^^xsd:date ; '
+                        f'dcterms:description {_literal(_words(rng, 8))}@en .\n')
+
+            f.write(' ;\n    '.join(lines) + ' .\n')
+
+    for c in range(collections):
+        collection = f':collection{c}'
+        members = rng.sample(concept_uris, min(collection_size, len(concept_uris)))
+        f.write(f'\n{collection} a skos:Collection ;\n'
+                f'    skos:prefLabel {_literal(f"Collection {c} {_words(rng, 2)}")}@en ;\n'
+                f'    skos:member {", ".join(members)} .\n')
+
+
+def add_arguments(parser):
+    parser.add_argument('--concepts', type=int, default=10000)
+    parser.add_argument('--schemes', type=int, default=1)
+    parser.add_argument('--branching', type=int, default=10,
+                        help='narrower concepts per concept, 1 for deep hierarchies, large for wide ones')
+    parser.add_argument('--top-concepts', type=int, default=10, help='top concepts per scheme')
+    parser.add_argument('--alt-labels', type=int, default=2, help='alternative labels per concept')
+    parser.add_argument('--mapping-ratio', type=float, default=0.05,
+                        help='fraction of concepts mapped to a concept of another scheme')
+    parser.add_argument('--deprecated-ratio', type=float, default=0.02)
+    parser.add_argument('--collections', type=int, default=2)
+    parser.add_argument('--collection-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def generate_from_arguments(f, args):
+    generate(f, concepts=args.concepts, schemes=args.schemes, branching=args.branching,
+             top_concepts=args.top_concepts, alt_labels=args.alt_labels, mapping_ratio=args.mapping_ratio,
+             deprecated_ratio=args.deprecated_ratio, collections=args.collections,
+             collection_size=args.collection_size, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    add_arguments(parser)
+    args = parser.parse_args()
+    with open(args.path, 'w', encoding='utf-8') as f:
+        generate_from_arguments(f, args)
+
+
+if __name__ == '__main__':
+    main()
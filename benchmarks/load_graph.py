@@ -0,0 +1,60 @@
+"""
+Compare the time to load the harvested data from Turtle against loading it from a binary snapshot.
+
+Usage (from the repository root):
+    python -m benchmarks.load_graph [path/to/data.ttl] [--repeat N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from rdflib import Graph
+
+import snapshot
+
+
+def _time(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', default='data/data.ttl')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    def parse_turtle():
+        g = Graph()
+        g.parse(args.path, format='turtle')
+        return g
+
+    turtle_seconds, g = _time(parse_turtle, args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, 'data.snapshot')
+        digest = snapshot.file_digest(args.path)
+        write_seconds, _ = _time(lambda: snapshot.write_snapshot(g, snapshot_path, digest), 1)
+        # Include hashing the Turtle file, which load_graph() does to validate the snapshot.
+        snapshot_seconds, snapshot_g = _time(
+            lambda: snapshot.read_snapshot(snapshot_path, snapshot.file_digest(args.path)), args.repeat)
+        snapshot_size = os.path.getsize(snapshot_path)
+
+    assert len(snapshot_g) == len(g)
+
+    print(f'triples:          {len(g)}')
+    print(f'turtle size:      {os.path.getsize(args.path) / 1e6:.1f} MB')
+    print(f'snapshot size:    {snapshot_size / 1e6:.1f} MB')
+    print(f'turtle load:      {turtle_seconds:.3f} s')
+    print(f'snapshot write:   {write_seconds:.3f} s')
+    print(f'snapshot load:    {snapshot_seconds:.3f} s ({turtle_seconds / snapshot_seconds:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare the OWL 2 RL closure against the SKOS-only reasoner in inference.py.
+
+Both reasoners run over the same data plus the SKOS ontology (which OWL-RL needs for its axioms). The triples the
+viewer reads are compared between the two results.
+
+Usage (from the repository root):
+    python -m benchmarks.reasoner [path/to/data.ttl] [--ontology local_vocabs/skos.ttl]
+"""
+import argparse
+import time
+
+from owlrl import DeductiveClosure, OWLRL_Semantics
+from rdflib import Graph
+from rdflib.namespace import RDF, SKOS
+
+import inference
+
+# The predicates and classes the viewer reads.
+UI_PREDICATES = [SKOS.broader, SKOS.narrower, SKOS.hasTopConcept, SKOS.topConceptOf, SKOS.inScheme, SKOS.member,
+                 SKOS.closeMatch, SKOS.exactMatch]
+UI_CLASSES = [SKOS.Concept, SKOS.ConceptScheme, SKOS.Collection]
+
+
+def _ui_triples(g):
+    triples = set()
+    for p in UI_PREDICATES:
+        triples.update(g.triples((None, p, None)))
+    for c in UI_CLASSES:
+        triples.update(g.triples((None, RDF.type, c)))
+    return triples
+
+
+def _run(name, g, expand):
+    before = len(g)
+    start = time.perf_counter()
+    expand(g)
+    seconds = time.perf_counter() - start
+    print(f'{name:8} {seconds:10.2f} s {before:12} -> {len(g):10} triples (+{len(g) - before})')
+    return g
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', default='data/data.ttl')
+    parser.add_argument('--ontology', default='local_vocabs/skos.ttl')
+    args = parser.parse_args()
+
+    def load():
+        g = Graph()
+        g.parse(args.path, format='turtle')
+        g.parse(args.ontology, format='turtle')
+        return g
+
+    print(f'{"reasoner":8} {"time":>12} {"input":>12}    {"output":>10}')
+    owlrl_g = _run('owlrl', load(), lambda g: DeductiveClosure(OWLRL_Semantics).expand(g))
+    skos_g = _run('skos', load(), inference.expand)
+
+    owlrl_ui, skos_ui = _ui_triples(owlrl_g), _ui_triples(skos_g)
+    print(f'viewer triples: owlrl {len(owlrl_ui)}, skos {len(skos_ui)}, '
+          f'only in owlrl {len(owlrl_ui - skos_ui)}, only in skos {len(skos_ui - owlrl_ui)}')
+
+
+if __name__ == '__main__':
+    main()
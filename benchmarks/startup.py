@@ -0,0 +1,153 @@
+"""
+Report what starting a web worker costs: the time to import the application, the time of its first request and the
+modules imported by each, from `python -X importtime`.
+
+Every run starts a fresh interpreter in a temporary working directory without data, so loading the graph on a
+background thread does not overlap the import and the first request only includes the application's start-up hooks.
+Loading the data is measured by benchmarks/load_graph.py. With --baseline, the same is measured for the application at
+another git revision, to show the saving per worker.
+
+Usage (from the repository root):
+    python -m benchmarks.startup [--baseline REV] [--runs N] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Modules the web process should not need to import to start serving.
+HEAVY_MODULES = ('celery', 'kombu', 'owlrl', 'markdown', 'requests', 'munch', 'yaml', 'pyldapi')
+
+_MARKER = 'vocview-startup: first request'
+
+_CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+import_modules = sorted(sys.modules)
+import graph_management
+graph_management.pin_version(None)
+graph_management.unpin_version()
+sys.stderr.write({marker!r} + '\\n')
+client = app.app.test_client()
+start = time.perf_counter()
+client.get('/').get_data()
+first_request = time.perf_counter() - start
+print(json.dumps({{'import': imported, 'first_request': first_request, 'import_modules': import_modules,
+                  'modules': sorted(sys.modules)}}))
+'''.format(marker=_MARKER)
+
+
+def _parse_importtime(lines):
+    """Self time in seconds of each top-level package imported, from -X importtime output."""
+    packages = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        if package == 'app':
+            # The graph reloader thread starts importing as app finishes, which breaks the nesting -X importtime
+            # reports, so the self time of app includes its imports. Its total is reported as the import time.
+            continue
+        packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+    return packages
+
+
+def _run_once(source_dir, work_dir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (source_dir, env.get('PYTHONPATH'))))
+    env['CELERY_BROKER_URL'] = 'filesystem://'
+    env['CELERY_BROKER_FOLDER'] = os.path.join(work_dir, 'broker')
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD], cwd=work_dir, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError(f'Starting the application from {source_dir} failed:\n{process.stderr}')
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    stderr = process.stderr.splitlines()
+    split = stderr.index(_MARKER) if _MARKER in stderr else len(stderr)
+    result['import_packages'] = _parse_importtime(stderr[:split])
+    result['first_request_packages'] = _parse_importtime(stderr[split:])
+    return result
+
+
+def measure(source_dir, work_dir, runs):
+    results = [_run_once(source_dir, work_dir) for _ in range(runs)]
+    last = results[-1]
+    return {
+        'import': statistics.median(r['import'] for r in results),
+        'first_request': statistics.median(r['first_request'] for r in results),
+        'import_modules': len(last['import_modules']),
+        'modules': len(last['modules']),
+        'heavy_modules_on_import': [m for m in HEAVY_MODULES if m in last['import_modules']],
+        'heavy_modules_after_first_request': [m for m in HEAVY_MODULES if m in last['modules']],
+        'import_packages': last['import_packages'],
+        'first_request_packages': last['first_request_packages'],
+    }
+
+
+def _export(revision, target_dir):
+    archive = subprocess.run(['git', 'archive', revision], stdout=subprocess.PIPE, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', target_dir], input=archive, check=True)
+
+
+def _print_report(reports, top):
+    names = list(reports)
+    print(f'{"":40}' + ''.join(f'{name:>20}' for name in names))
+    for label, key, scale in (('import app (ms)', 'import', 1000), ('first request (ms)', 'first_request', 1000),
+                              ('modules after import', 'import_modules', 1),
+                              ('modules after first request', 'modules', 1)):
+        print(f'{label:40}' + ''.join(f'{reports[name][key] * scale:20.1f}' if scale != 1 else
+                                      f'{reports[name][key]:20}' for name in names))
+    for label, key in (('heavy modules on import', 'heavy_modules_on_import'),
+                       ('heavy modules after first request', 'heavy_modules_after_first_request')):
+        for name in names:
+            print(f'{label} ({name}): {", ".join(reports[name][key]) or "none"}')
+
+    for name in names:
+        for phase in ('import', 'first_request'):
+            packages = sorted(reports[name][f'{phase}_packages'].items(), key=lambda item: -item[1])[:top]
+            print(f'\nSlowest packages to import during {phase.replace("_", " ")} ({name}), self time in ms:')
+            for package, seconds in packages:
+                print(f'  {package:38} {seconds * 1000:8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help='git revision to compare against, such as a release tag')
+    parser.add_argument('--runs', type=int, default=5, help='interpreters to start for each revision')
+    parser.add_argument('--top', type=int, default=10, help='packages to list by import time')
+    parser.add_argument('--output', help='JSON file to write the measurements to')
+    args = parser.parse_args()
+
+    repository_dir = os.getcwd()
+    temp_dir = tempfile.mkdtemp(prefix='vocview-startup-')
+    try:
+        work_dir = os.path.join(temp_dir, 'work')
+        os.makedirs(os.path.join(work_dir, 'data'))
+        # Older revisions read the version from the working directory.
+        shutil.copyfile(os.path.join(repository_dir, 'CHANGELOG.md'), os.path.join(work_dir, 'CHANGELOG.md'))
+
+        reports = {}
+        if args.baseline:
+            baseline_dir = os.path.join(temp_dir, 'baseline')
+            os.makedirs(baseline_dir)
+            _export(args.baseline, baseline_dir)
+            reports[args.baseline] = measure(baseline_dir, work_dir, args.runs)
+        reports['working tree'] = measure(repository_dir, work_dir, args.runs)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    _print_report(reports, args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(reports, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
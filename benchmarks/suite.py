@@ -0,0 +1,217 @@
+"""
+Benchmark the viewer end to end on a synthetic vocabulary (see benchmarks/generate.py) or on given data.
+
+Times load_graph (from Turtle and from the snapshot), list_concepts, get_concept_hierarchy (full and lazy), the ob
+route for each SKOS class, the registers, register search and /download. The application runs in a temporary working
+directory through Flask's test client, with the rendered-page cache disabled and every per-version memo of concept
+trees cleared before each timed page, so page timings are cold renders.
+
+Results are written as JSON (to stdout or --output) for comparing releases. A summary table goes to stderr.
+
+Usage (from the repository root):
+    python -m benchmarks.suite [--data path/to/data.ttl] [generator options] [--samples N] [--output results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.generate import add_arguments, generate_from_arguments
+
+SEARCH_QUERIES = ('soil', 'veg', 'soil water', '0.5', 'zzzz')
+DOWNLOADS = (
+    # format, gzip accepted
+    ('turtle', True),
+    ('turtle', False),
+    ('nt', True),
+    # Not written by the suite, served as streamed N-Triples.
+    ('xml', True),
+)
+
+
+def _summary(timings):
+    timings = sorted(timings)
+    return {
+        'count': len(timings),
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'p95': timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        'max': timings[-1],
+        'mean': statistics.mean(timings),
+    }
+
+
+def _time(fn, repeat=1):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def run(args):
+    """Run the benchmarks in the current working directory, which holds data/data.ttl."""
+    # Imported here, as the configuration is read from the working directory and the environment on import.
+    from rdflib.namespace import SKOS
+    from config import Config
+    import downloads
+    import graph_management
+    import skos
+    import snapshot
+
+    results = {}
+    rng = random.Random(args.seed)
+
+    # Parse Turtle before the snapshot exists, then load the snapshot like a web worker does.
+    timings, version = _time(graph_management.load_graph, args.repeat)
+    results['load_graph.turtle'] = timings
+    digest = snapshot.file_digest(Config.data_path)
+    snapshot.write_snapshot(version.graph, Config.snapshot_path, digest)
+    downloads.write_artifacts(version.graph, digest.hex(), formats=sorted({f for f, _ in DOWNLOADS} - {'xml'}))
+    del version
+    results['load_graph.snapshot'], _ = _time(graph_management.load_graph, args.repeat)
+
+    import app
+    logging.getLogger().setLevel(logging.WARNING)
+    client = app.app.test_client()
+    # Wait for the application's own load of the data.
+    graph_management.pin_version(None)
+    graph_management.unpin_version()
+    version = graph_management.current_version()
+    index = version.index
+
+    results['list_concepts'], _ = _time(skos.list_concepts, args.repeat)
+
+    def sample(uris):
+        uris = sorted(uris)
+        return rng.sample(uris, min(args.samples, len(uris)))
+
+    uris = {
+        class_type: sample(uri for uri, types in index.types.items() if getattr(SKOS, class_type) in types)
+        for class_type in ('Concept', 'ConceptScheme', 'Collection')
+    }
+
+    def clear_memos():
+        version.concept_trees.clear()
+        version.hierarchy_children.clear()
+
+    for mode in ('full', 'lazy'):
+        for class_type, hierarchy in (('ConceptScheme', skos.get_concept_hierarchy),
+                                      ('Collection', skos.get_concept_hierarchy_collection)):
+            timings = []
+            for uri in uris[class_type]:
+                with app.app.test_request_context(f'/id/{uri}?hierarchy={mode}'):
+                    clear_memos()
+                    timings += _time(lambda: hierarchy(uri))[0]
+            if timings:
+                results[f'get_concept_hierarchy.{class_type}.{mode}'] = timings
+
+    def get(url, **kwargs):
+        response = client.get(url, **kwargs)
+        # Reading the data runs streamed responses to the end.
+        response.get_data()
+        assert response.status_code == 200, f'{url}: {response.status_code}'
+        return response
+
+    # The first request runs the application's start-up hooks and fills the label cache, so it is not timed.
+    get('/')
+    for class_type, class_uris in uris.items():
+        timings = []
+        for uri in class_uris:
+            clear_memos()
+            timings += _time(lambda: get(f'/id/{uri}'))[0]
+        if timings:
+            results[f'ob.{class_type}'] = timings
+
+    page_count = max(len(index.concepts) // Config.register_page_size, 1)
+    for name, url in (('concept', '/concept/'), ('vocabulary', '/vocabulary/')):
+        results[f'register.{name}.first_page'], _ = _time(lambda: get(url), args.repeat)
+    results['register.concept.random_page'] = [
+        _time(lambda: get(f'/concept/?page={rng.randint(1, page_count)}'))[0][0] for _ in range(args.samples)
+    ]
+
+    for query in SEARCH_QUERIES:
+        results[f'search_concepts.{query}'], _ = _time(lambda: skos.search_concepts(query), args.repeat)
+        results[f'register.concept.search.{query}'], _ = _time(lambda: get('/concept/', query_string={'search': query}),
+                                                               args.repeat)
+
+    for format, gzip in DOWNLOADS:
+        headers = {'Accept-Encoding': 'gzip'} if gzip else {'Accept-Encoding': 'identity'}
+        results[f'download.{format}{".gzip" if gzip else ""}'], _ = _time(
+            lambda: get(f'/download?format={format}', headers=headers), args.repeat)
+
+    meta = {
+        'vocview': Config._version,
+        'python': platform.python_version(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'parameters': vars(args),
+        'triples': len(version.graph),
+        'concepts': len(index.concepts),
+        'concept_schemes': sum(1 for types in index.types.values() if SKOS.ConceptScheme in types),
+        'collections': sum(1 for types in index.types.values() if SKOS.Collection in types),
+    }
+    return meta, {name: _summary(timings) for name, timings in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', help='Turtle file to benchmark instead of a generated vocabulary')
+    parser.add_argument('--samples', type=int, default=20, help='URIs of each class and random pages to request')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file to write, stdout by default')
+    parser.add_argument('--keep', help='Directory to keep the working directory in, such as the generated data')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    repository_dir = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    work_dir = tempfile.mkdtemp(prefix='vocview-benchmark-')
+    try:
+        os.makedirs(os.path.join(work_dir, 'data'))
+        data_path = os.path.join(work_dir, 'data', 'data.ttl')
+        if args.data:
+            shutil.copyfile(args.data, data_path)
+        else:
+            start = time.perf_counter()
+            with open(data_path, 'w', encoding='utf-8') as f:
+                generate_from_arguments(f, args)
+            print(f'Generated {os.path.getsize(data_path) / 1e6:.1f} MB of Turtle in '
+                  f'{time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+        # Measure rendering, not the cache of rendered pages.
+        os.environ['VOCVIEW_RESPONSE_CACHE_MAX_BYTES'] = '0'
+        # Metrics stay in memory, they would otherwise be written to the repository when the suite exits.
+        os.environ['VOCVIEW_METRICS_DIR'] = ''
+        os.chdir(work_dir)
+        meta, results = run(args)
+    finally:
+        os.chdir(repository_dir)
+        if args.keep:
+            shutil.copytree(work_dir, args.keep)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f'{"benchmark":45} {"median ms":>10} {"p95 ms":>10} {"max ms":>10}', file=sys.stderr)
+    for name, summary in results.items():
+        print(f'{name:45} {summary["median"] * 1000:10.1f} {summary["p95"] * 1000:10.1f} {summary["max"] * 1000:10.1f}',
+              file=sys.stderr)
+
+    data = json.dumps({'meta': meta, 'results': results}, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
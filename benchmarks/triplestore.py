@@ -0,0 +1,122 @@
+"""
+Compare the triplestore backends (memory, mmap and sqlite) on the harvested data.
+
+Each backend is measured in a fresh process: the time to open the graph, to build the SKOS index of a graph version
+and to run the triple-pattern lookups a concept page issues for a sample of concepts, and the memory the process
+gained.
+
+Usage (from the repository root):
+    python -m benchmarks.triplestore [path/to/data.ttl] [--sample N]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from rdflib import Graph
+from rdflib.namespace import RDF, SKOS
+
+import mmap_store
+import snapshot
+import sqlite_store
+from skos.index import SkosIndex
+
+BACKENDS = ('memory', 'mmap', 'sqlite')
+
+
+def _rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _open(backend, directory, digest):
+    if backend == 'memory':
+        return snapshot.read_snapshot(os.path.join(directory, 'data.snapshot'), digest)
+    if backend == 'mmap':
+        return mmap_store.open_graph(os.path.join(directory, 'data.mmap'), digest)
+    return sqlite_store.open_graph(os.path.join(directory, 'data.sqlite'), digest)
+
+
+def measure(backend, directory, digest, sample):
+    """Measure one backend in the current process."""
+    rss = _rss_mb()
+    results = {'backend': backend}
+
+    start = time.perf_counter()
+    g = _open(backend, directory, digest)
+    results['open_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concepts = sorted(g.subjects(RDF.type, SKOS.Concept))
+    results['concepts_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    SkosIndex(g)
+    results['index_seconds'] = time.perf_counter() - start
+
+    concepts = random.Random(0).sample(concepts, min(sample, len(concepts)))
+    start = time.perf_counter()
+    for uri in concepts:
+        list(g.objects(uri, SKOS.prefLabel))
+        list(g.predicate_objects(uri))
+        list(g.subjects(SKOS.broader, uri))
+    results['lookups_per_concept_ms'] = (time.perf_counter() - start) / max(len(concepts), 1) * 1000
+
+    results['rss_mb'] = _rss_mb() - rss
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', default='data/data.ttl')
+    parser.add_argument('--sample', type=int, default=1000)
+    parser.add_argument('--measure', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--directory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    digest = snapshot.file_digest(args.path)
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.directory, digest, args.sample)))
+        return
+
+    g = Graph()
+    g.parse(args.path, format='turtle')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writes = {}
+        for backend, write, name in (('memory', snapshot.write_snapshot, 'data.snapshot'),
+                                     ('mmap', mmap_store.write, 'data.mmap'),
+                                     ('sqlite', sqlite_store.write, 'data.sqlite')):
+            start = time.perf_counter()
+            write(g, os.path.join(tmp_dir, name), digest)
+            writes[backend] = (time.perf_counter() - start, os.path.getsize(os.path.join(tmp_dir, name)))
+        triple_count = len(g)
+        del g
+
+        results = []
+        for backend in BACKENDS:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.triplestore', args.path, '--sample', str(args.sample),
+                 '--measure', backend, '--directory', tmp_dir],
+                check=True, stdout=subprocess.PIPE).stdout
+            results.append(json.loads(output))
+
+    print(f'triples: {triple_count}')
+    print(f'{"backend":8} {"write s":>8} {"size MB":>8} {"open s":>8} {"concepts s":>10} {"index s":>8} '
+          f'{"lookups ms":>10} {"RSS MB":>8}')
+    for r in results:
+        write_seconds, size = writes[r['backend']]
+        print(f'{r["backend"]:8} {write_seconds:8.2f} {size / 1e6:8.1f} {r["open_seconds"]:8.2f} '
+              f'{r["concepts_seconds"]:10.2f} {r["index_seconds"]:8.2f} {r["lookups_per_concept_ms"]:10.3f} '
+              f'{r["rss_mb"]:8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,11 +8,13 @@ load_dotenv()
 
 
 def get_version():
-    with open('CHANGELOG.md', 'r') as f:
-        while True:
-            line = f.readline()
-            if re.search('## \[[0-9].[0-9].[0-9]\]', line):
-                return line.split('[')[1].split(']')[0]
+    """The latest released version in the CHANGELOG.md next to this file."""
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'CHANGELOG.md'), 'r') as f:
+        for line in f:
+            match = re.match(r'## \[([0-9]+\.[0-9]+\.[0-9]+)\]', line)
+            if match:
+                return match.group(1)
+    return None
 
 
 class Config:
@@ -33,8 +35,101 @@ class Config:
     # Vocabulary sources config. file.
     VOCAB_SOURCES = 'vocabs.yaml'
 
-    # Rule-based reasoner
-    reasoner = True
+    # Harvested data written by the background task and loaded by the web application.
+    data_path = 'data/data.ttl'
+
+    # Binary snapshot of the harvested data. Loaded instead of data_path when it matches the Turtle file.
+    snapshot_path = 'data/data.snapshot'
+
+    # Disk stores of the harvested data, used when triplestore_type is mmap or sqlite.
+    mmap_path = 'data/data.mmap'
+    sqlite_path = 'data/data.sqlite'
+
+    # Compressed serializations of the harvested data served by the /download route.
+    downloads_dir = 'data/downloads'
+
+    # Seconds a request waits for the first graph load of a freshly started worker before it is served from an empty
+    # graph. Requests never load data themselves.
+    graph_load_timeout = float(os.environ.get('VOCVIEW_GRAPH_LOAD_TIMEOUT', '20'))
+
+    # -- External labels -----------------------------------------------------------------------------------------------
+    #
+    # Labels of URIs without a label in the graph are fetched by dereferencing the URI. Results are cached in a SQLite
+    # database shared by all workers.
+    label_cache_path = 'data/labels.sqlite'
+    label_cache_max_entries = int(os.environ.get('VOCVIEW_LABEL_CACHE_MAX_ENTRIES', '10000'))
+    label_cache_ttl = int(os.environ.get('VOCVIEW_LABEL_CACHE_TTL', str(7 * 24 * 60 * 60)))
+    # Failed lookups are retried after this many seconds.
+    label_cache_negative_ttl = int(os.environ.get('VOCVIEW_LABEL_CACHE_NEGATIVE_TTL', str(60 * 60)))
+    # Hard limit in seconds for a single lookup, including reading the response.
+    label_fetch_timeout = float(os.environ.get('VOCVIEW_LABEL_FETCH_TIMEOUT', '2'))
+
+    # -- Harvest -------------------------------------------------------------------------------------------------------
+    #
+    # Maximum number of download sources fetched and parsed at the same time.
+    harvest_concurrency = int(os.environ.get('VOCVIEW_HARVEST_CONCURRENCY', '4'))
+    # Timeout in seconds for fetching a single download source.
+    harvest_timeout = float(os.environ.get('VOCVIEW_HARVEST_TIMEOUT', '300'))
+    # Validators (ETag, Last-Modified, content hash) and parsed copies of each source from the previous harvest.
+    harvest_dir = 'data/harvest'
+
+    # Rule-based reasoner run by the background task over the harvested data.
+    #
+    # Options:
+    #
+    # - owlrl
+    #   - Full OWL 2 RL closure. Slow on large vocabularies and adds many axiomatic triples the viewer never reads.
+    #
+    # - skos
+    #   - Only the SKOS entailments the viewer reads (inverse broader/narrower, topConceptOf/hasTopConcept, inScheme
+    #     from topConceptOf, symmetric mappings and SKOS class types). See inference.py.
+    #
+    # - none
+    #   - No reasoning.
+    reasoner = os.environ.get('VOCVIEW_REASONER', 'owlrl')
+
+    # Limits of the concept hierarchy rendered on concept scheme and collection pages. Deeper concepts are not shown
+    # and the hierarchy is cut off after the maximum number of concepts.
+    hierarchy_max_depth = int(os.environ.get('VOCVIEW_HIERARCHY_MAX_DEPTH', '100'))
+    hierarchy_max_nodes = int(os.environ.get('VOCVIEW_HIERARCHY_MAX_NODES', '50000'))
+    # Hierarchies with more concepts than this only render their top level. Deeper levels are loaded when they are
+    # expanded, a page of children at a time.
+    hierarchy_lazy_threshold = int(os.environ.get('VOCVIEW_HIERARCHY_LAZY_THRESHOLD', '2000'))
+    hierarchy_page_size = int(os.environ.get('VOCVIEW_HIERARCHY_PAGE_SIZE', '100'))
+    hierarchy_page_size_max = 1000
+
+    # Cache-Control header of pages, RDF documents and downloads. Responses carry an ETag and Last-Modified derived from
+    # the loaded data, so the default lets caches store them as long as they revalidate on every use.
+    cache_control = os.environ.get('VOCVIEW_CACHE_CONTROL', 'no-cache')
+
+    # Memory budget in bytes of the cache of rendered concept, concept scheme and collection pages. 0 disables the cache.
+    response_cache_max_bytes = int(os.environ.get('VOCVIEW_RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    # Directory of an on-disk tier of the cache, shared by all workers. Disabled if empty.
+    response_cache_dir = os.environ.get('VOCVIEW_RESPONSE_CACHE_DIR', '')
+    # Size budget in bytes of the on-disk tier. The least recently written pages are removed once it is exceeded.
+    response_cache_dir_max_bytes = int(os.environ.get('VOCVIEW_RESPONSE_CACHE_DIR_MAX_BYTES', str(256 * 1024 * 1024)))
+
+    # Trace the graph lookups of every request (see graph_trace.py). One of off, header (X-Graph-Trace response headers),
+    # log or all. Adds overhead to every lookup, for finding slow pages only.
+    graph_trace = os.environ.get('VOCVIEW_GRAPH_TRACE', 'off')
+
+    # Secret that runs a single /id/ or register request under a sampling profiler (see profiler.py) when it is sent in
+    # the X-Profile header or the _profile query parameter. Disabled if empty. Profiles are written to profile_dir as
+    # speedscope files or, with profile_format collapsed, as collapsed stacks for flamegraph.pl.
+    profile_secret = os.environ.get('VOCVIEW_PROFILE_SECRET', '')
+    profile_dir = os.environ.get('VOCVIEW_PROFILE_DIR', 'data/profiles')
+    profile_format = os.environ.get('VOCVIEW_PROFILE_FORMAT', 'speedscope')
+    # Seconds between samples of the stack of the profiled request.
+    profile_interval = float(os.environ.get('VOCVIEW_PROFILE_INTERVAL', '0.001'))
+
+    # Directory where each web worker and background task process writes its metrics for /metrics to merge. Counters of
+    # exited processes are kept, folded into a single file. If empty, /metrics only reports the worker serving it.
+    metrics_dir = os.environ.get('VOCVIEW_METRICS_DIR', 'data/metrics')
+
+    # Default number of items on a page of the concept and vocabulary registers. The per_page query parameter
+    # overrides it up to register_page_size_max.
+    register_page_size = int(os.environ.get('VOCVIEW_REGISTER_PAGE_SIZE', '20'))
+    register_page_size_max = int(os.environ.get('VOCVIEW_REGISTER_PAGE_SIZE_MAX', '100'))
 
     FLASK_ENV = os.environ.get('FLASK_ENV', 'production')
 
@@ -43,36 +138,38 @@ class Config:
     # Options:
     #
     # - memory
-    #   - No persistence, load in triples on instance start-up (slow start-up time). Graph is required to be kept in
-    #     memory during application's lifetime. Not recommended due to slow start-up.
+    #   - The whole graph is loaded into each web worker's memory, from the binary snapshot written by the background
+    #     task (or from the Turtle file if the snapshot is stale). Fastest lookups, but every worker holds its own copy
+    #     of the graph.
     #   - Difficulty: easy
     #
     # - pickle
-    #   - Persistent store by saving a binary (pickle) copy of the Python rdflib.Graph object to disk. Graph is
-    #     required to be in memory during application's lifetime. Fast start-up time and fast performance, uses
-    #     significantly more memory than Sleepycat. Exact same as the memory method except it persists between
-    #     application restarts.
+    #   - Same as memory. The snapshot is the persisted (pickled) copy of the graph.
+    #
+    # - mmap
+    #   - Read-only store in a file written by the background task and memory-mapped by every web worker (see
+    #     mmap_store.py). The workers share a single copy of the graph in the operating system's page cache, so adding
+    #     workers adds close to no memory for the graph. Lookups are somewhat slower than in memory.
     #   - Difficulty: easy
     #
-    # - sleepycat
-    #   - Persistent store by storing the triples in the now defunct Sleepycat's Berkeley DB store. Requires external
-    #     libraries to be installed on the system before using. Does not require to have the whole triplestore in
-    #     memory. Performance is slightly slower than the pickle method (maybe around 10-20%) but uses much less memory.
-    #     For each request, only the required triples are loaded into the application's memory.
-    #   - Difficulty: intermediate
-    triplestore_type = 'memory' if FLASK_ENV == 'production' else 'pickle'
+    # - sqlite
+    #   - Read-only SQLite database with SPO, POS and OSP indexes written by the background task (see sqlite_store.py).
+    #     Of the graph, each worker only holds SQLite's page cache, bounded by sqlite_cache_kib. The SKOS and search
+    #     indexes are still built in memory. Lookups are slower than in memory.
+    #   - Difficulty: easy
+    #
+    # The Sleepycat (Berkeley DB) store is not supported.
+    triplestore_type = os.environ.get('VOCVIEW_TRIPLESTORE_TYPE', 'memory')
+
+    # Page cache size in KiB of each web worker's connection to the SQLite store.
+    sqlite_cache_kib = int(os.environ.get('VOCVIEW_SQLITE_CACHE_KIB', '16384'))
 
     # The time which the store is valid before re-harvesting in the background.
     # store_hours = int(os.environ.get('VOCVIEW_STORE_HOURS', '0'))
     # store_minutes = int(os.environ.get('VOCVIEW_STORE_MINUTES', '60'))
     store_seconds = int(os.environ.get('VOCVIEW_STORE_SECONDS', '3600'))
 
-    # Triplestore disk path
-    _triplestore_name_pickle = 'triplestore.p'
-    triplestore_path_pickle = os.path.join(APP_DIR, _triplestore_name_pickle)
-    _triplestore_name_sleepy_cat = 'triplestore'
-    triplestore_path_sleepy_cat = os.path.join(APP_DIR, _triplestore_name_sleepy_cat)
-
     _version = get_version()
 
+    # Set to a graph_management.PinnedGraph, which reads the graph version pinned by the current request.
     g: Graph
@@ -1,41 +1,22 @@
-from flask import Blueprint, render_template, request, Response, redirect
-from munch import munchify
-from pyldapi import Renderer
+import os
+
+from flask import Blueprint, render_template, request, Response, redirect, send_file, jsonify, url_for
 
 from config import Config
+import downloads
+import graph_management
+import http_cache
+import metrics
 import skos
 
 routes = Blueprint('routes', __name__)
 
 
-def match(vocabs, query):
-    """
-    Generate a generator of vocabulary items that match the search query
-    :param vocabs: The vocabulary list of items.
-    :param query: The search query string.
-    :return: A generator of words that match the search query.
-    :rtype: generator
-    """
-    for word in vocabs:
-        if query.lower() in word[1].lower():
-            yield word
-
-
-def process_search(query, items):
-    results = []
-
-    if query:
-        for m in match(items, query):
-            results.append(m)
-        results.sort(key=lambda v: v[1])
-
-        return results
-
-    return items
-
-
 @routes.route('/download', methods=['GET'])
 def download():
+    # Imported here rather than at start-up, see skos.__getattr__().
+    from pyldapi import Renderer
+
     format = request.args.get('format')
 
     if format is None:
@@ -46,19 +27,36 @@ def download():
         return '<h2>Invalid download format type</h2>\nPlease set the format type to be one of the following values: {}'\
             .format(set(Renderer.RDF_SERIALIZER_MAP.values()))
 
+    version = graph_management.current_version()
+    compressed = 'gzip' in request.accept_encodings
+    path = downloads.artifact_path(version.id, format, compressed=compressed)
+    if not os.path.isfile(path):
+        # Not generated for this graph version (yet), stream N-Triples instead.
+        response = Response(
+            downloads.iter_ntriples(version.graph), mimetype='application/n-triples',
+            headers={'Content-Disposition': 'attachment; filename={}'.format(Config.title + downloads.FORMATS['nt'])}
+        )
+        # The requested format replaces it once it is written, so it must not be cached.
+        response.cache_control.no_store = True
+        return response
+
     mimetype=None
     for key, val in Renderer.RDF_SERIALIZER_MAP.items():
         if val == format:
             mimetype = key
 
-    file_extension = {'turtle': '.ttl', 'n3': '.n3', 'json-ld': '.jsonld', 'nt': '.nt', 'xml': '.rdf'}.get(format)
-
-    rdf_content = Config.g.serialize(format=format)
+    filename = Config.title + downloads.FORMATS[format]
 
-    return Response(
-        response=rdf_content, mimetype=mimetype,
-        headers={'Content-Disposition': 'attachment; filename={}'.format(Config.title + file_extension)}
-    )
+    # Served as a static file, with Content-Length, conditional and Range request support. The validators are the ones
+    # of every other response (see http_cache.py) rather than send_file's own, so If-Range and If-None-Match are checked
+    # against the same ETag.
+    response = send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True, attachment_filename=filename,
+                         add_etags=False)
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    http_cache.add_validators(response, version)
+    return response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
 
 
 @routes.route('/', methods=['GET'])
@@ -68,51 +66,39 @@ def index():
 
 @routes.route('/vocabulary/', methods=['GET'])
 def render_vocabulary_register():
-    page = request.values.get('page')
-    if page is None:
-        page = 1
-
-    items = skos.list_concept_schemes_and_collections()
-
     query = request.values.get('search')
-    items = process_search(query, items)
-    
-    total_items_count = len(items)
-    page_from = int(page)
-    page_size = 20
+    if query:
+        items = skos.search_concept_schemes_and_collections(query)
+    else:
+        items = skos.list_concept_schemes_and_collections()
 
-    items = items[(page_from - 1) * page_size:page_size * page_from]
+    total_items_count = len(items)
 
     # TODO: Check why munchify is duplicating the dct:created and dct:modified data in an element of item.
     # items = munchify(items)
 
     r = skos.Register(request, 'Register of SKOS vocabularies',
                       'This register contains a listing of SKOS vocabularies as concept schemes or collections.',
-                      items, ['http://www.w3.org/2004/02/skos/core#ConceptScheme', 'http://www.w3.org/2004/02/skos/core#Collection'],
+                      None, ['http://www.w3.org/2004/02/skos/core#ConceptScheme', 'http://www.w3.org/2004/02/skos/core#Collection'],
                       total_items_count=total_items_count,
                       register_template='register.html',
                       title='Vocabularies',
                       description='Register of all vocabularies in this system.',
                       search_query=query)
+    # The page and page size are parsed and bounded by the register, only the rows of that page are filled in.
+    r.register_items = skos.vocabulary_register_items(r.page_items(items))
     return r.render()
 
 
 @routes.route('/concept/', methods=['GET'])
 def render_concept_register():
-    page = request.values.get('page')
-    if page is None:
-        page = 1
-
-    items = skos.list_concepts()
-
     query = request.values.get('search')
-    items = process_search(query, items)
-    
-    total_items_count = len(items)
-    page_from = int(page)
-    page_size = 20
+    if query:
+        items = skos.search_concepts(query)
+    else:
+        items = skos.list_concepts()
 
-    items = items[(page_from - 1) * page_size:page_size * page_from]
+    total_items_count = len(items)
 
     # TODO: Check why munchify is duplicating the dct:created and dct:modified data in an element of item.
     # items = munchify(items)
@@ -120,15 +106,56 @@ def render_concept_register():
     r = skos.Register(request,
                       'Register of SKOS concepts',
                       'This register contains a listing of all SKOS concepts within this system.',
-                      items, ['http://www.w3.org/2004/02/skos/core#Concept'],
+                      None, ['http://www.w3.org/2004/02/skos/core#Concept'],
                       total_items_count=total_items_count,
                       register_template='register.html',
                       title='Concepts',
                       description='Register of all vocabulary concepts in this system.',
                       search_query=query)
+    # The page and page size are parsed and bounded by the register, only the rows of that page are filled in.
+    r.register_items = skos.concept_register_items(r.page_items(items))
     return r.render()
 
 
+@routes.route('/hierarchy/children', methods=['GET'])
+def hierarchy_children():
+    """A page of the children of a concept scheme, collection or concept in the concept hierarchy, as JSON."""
+    uri = request.args.get('uri')
+    if not uri:
+        return jsonify(error='The uri query parameter is required.'), 400
+
+    page = max(request.args.get('page', type=int, default=1), 1)
+    per_page = request.args.get('per_page', type=int, default=Config.hierarchy_page_size)
+    per_page = min(max(per_page, 1), Config.hierarchy_page_size_max)
+
+    items = skos.get_hierarchy_children(uri)
+    if items is None:
+        return jsonify(error='The uri is not a concept scheme, collection or concept.'), 404
+    start = (page - 1) * per_page
+
+    children = []
+    for child, label in items[start:start + per_page]:
+        count = skos.count_hierarchy_children(child)
+        children.append({
+            'uri': child,
+            'label': label,
+            'url': url_for('routes.ob', uri=child),
+            'children': count,
+            'children_url': url_for('routes.hierarchy_children', uri=child) if count else None,
+        })
+
+    next_page = None
+    if start + per_page < len(items):
+        next_page = url_for('routes.hierarchy_children', uri=uri, page=page + 1, per_page=per_page)
+
+    return jsonify(uri=uri, page=page, per_page=per_page, total=len(items), children=children, next=next_page)
+
+
+@routes.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @routes.route('/id/<path:uri>', methods=['GET'])
 def ob(uri):
     # TODO: Issue with Apache, Flask, and WSGI interaction where multiple slashes are dropped to 1 (19/04/2019).
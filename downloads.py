@@ -0,0 +1,94 @@
+"""
+Pre-generated serializations of the whole graph for the /download route.
+
+The background task writes an uncompressed and a gzip-compressed file per format into a directory named after the
+digest of the data file, so the web application can tell which graph version an artifact belongs to. Both are served as
+static files, so clients that do not accept gzip get Content-Length and Range support too. Formats that are not written
+yet are served as streamed N-Triples instead.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+
+from rdflib import Graph
+from rdflib.plugins.serializers.nt import _nt_row
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# rdflib serializer name to file extension.
+FORMATS = {'turtle': '.ttl', 'n3': '.n3', 'json-ld': '.jsonld', 'nt': '.nt', 'xml': '.rdf'}
+
+# Artifact directories of older versions that are kept for requests still pinned to them.
+_KEEP_VERSIONS = 2
+
+_NT_BATCH_SIZE = 1000
+
+
+def artifact_path(version_id: str, format: str, compressed: bool = True) -> str:
+    path = os.path.join(Config.downloads_dir, version_id, format + FORMATS[format])
+    return path + '.gz' if compressed else path
+
+
+def scheme_export_path(version_id: str, uri: str, mimetype: str) -> str:
+    """Path of the cached RDF export of a concept scheme, written by the web application on first request."""
+    name = hashlib.sha1(f'{uri} {mimetype}'.encode('utf-8')).hexdigest()
+    return os.path.join(Config.downloads_dir, version_id, 'schemes', name)
+
+
+def _write(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _compress(source, path):
+    tmp_path = path + '.tmp'
+    with open(source, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+        shutil.copyfileobj(src, f, 1024 * 1024)
+    os.replace(tmp_path, path)
+
+
+def write_artifacts(g: Graph, version_id: str, turtle_data: bytes = None, formats=None):
+    """
+    Write uncompressed and gzip-compressed serializations of the graph for each format.
+
+    :param turtle_data: The graph already serialized as Turtle, so it does not have to be serialized again.
+    """
+    os.makedirs(os.path.join(Config.downloads_dir, version_id), exist_ok=True)
+    for format in formats or FORMATS:
+        path = artifact_path(version_id, format, compressed=False)
+        if not os.path.isfile(path):
+            logger.info(f'Writing {format} download artifact to {path}')
+            if format == 'turtle' and turtle_data is not None:
+                _write(path, lambda f: f.write(turtle_data))
+            else:
+                _write(path, lambda f: g.serialize(destination=f, format=format))
+        compressed_path = artifact_path(version_id, format)
+        if not os.path.isfile(compressed_path):
+            _compress(path, compressed_path)
+
+
+def remove_old_artifacts():
+    """Remove the artifacts of all but the most recently written versions."""
+    if not os.path.isdir(Config.downloads_dir):
+        return
+    paths = [os.path.join(Config.downloads_dir, name) for name in os.listdir(Config.downloads_dir)]
+    paths = sorted((path for path in paths if os.path.isdir(path)), key=os.path.getmtime, reverse=True)
+    for path in paths[_KEEP_VERSIONS:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def iter_ntriples(g: Graph):
+    """Serialize the graph as N-Triples in chunks, without building the whole serialization in memory."""
+    rows = []
+    for triple in g:
+        rows.append(_nt_row(triple))
+        if len(rows) == _NT_BATCH_SIZE:
+            yield ''.join(rows).encode('ascii', '_rdflib_nt_escape')
+            rows = []
+    yield ''.join(rows).encode('ascii', '_rdflib_nt_escape')
@@ -1,46 +1,271 @@
 import logging
 import os
+import threading
 import time
 import traceback
-from typing import Type
 
 from rdflib import Graph
 from watchdog.events import FileSystemEventHandler
 
 from config import Config
+import graph_trace
+import metrics
+import snapshot
+import triplestore
+from skos.index import SkosIndex
+from skos.search import SearchIndex
 
-last_trigger_time = time.time()
 logger = logging.getLogger(__name__)
 
 
-def load_graph(set_on_config: bool = False):
-    g = Graph()
-    path = 'data/data.ttl'
+class GraphVersion:
+    """
+    A fully loaded graph together with what identifies it.
+
+    Versions are built off the request path and published with a single reference assignment. A version's graph and
+    indexes are never modified after it is published, so a request that pinned it can keep reading it while a newer
+    one is loading. Only caches of content rendered from it are filled in later.
+    """
+    _counter = 0
+
+    def __init__(self, graph: Graph, digest: bytes = None, modified: float = None):
+        GraphVersion._counter += 1
+        self.number = GraphVersion._counter
+        self.graph = graph
+        # SHA-256 of the data file this version was loaded from. None if no data has been harvested yet.
+        self.digest = digest
+        # Modification time of the data file this version was loaded from.
+        self.modified = modified
+        # Built here, on the loading thread, so that requests only ever see a version with its index ready.
+        self.index = SkosIndex(graph)
+        self.concept_search = SearchIndex(graph, self.index.concepts)
+        self.vocabulary_search = SearchIndex(graph, self.index.vocabularies)
+        # Concept tree HTML by (concept scheme or collection URI, script root, mode), see skos.get_concept_hierarchy().
+        self.concept_trees = {}
+        # Sorted children of the nodes of concept hierarchies by URI, see skos.get_hierarchy_children().
+        self.hierarchy_children = {}
+        # DCAT JSON-LD of vocabulary register pages by (register path, page, page size), see
+        # skos.Register._generate_dcat_html_metadata().
+        self.dcat_metadata = {}
+        self.loaded_at = time.time()
+
+    @property
+    def id(self):
+        return self.digest.hex() if self.digest else 'empty'
+
+
+# The published version. Replaced as a whole by _publish(), never mutated.
+_current = GraphVersion(Graph())
+_loaded = threading.Event()
+_pinned = threading.local()
+
+
+def current_version() -> GraphVersion:
+    """The version pinned by the current request, or the latest published version outside of a request."""
+    return getattr(_pinned, 'version', None) or _current
+
+
+def pin_version(timeout: float = None) -> GraphVersion:
+    """Pin the latest published version to the current thread for the duration of a request."""
+    if not _loaded.is_set():
+        _loaded.wait(timeout)
+    _pinned.version = _current
+    return _pinned.version
+
+
+def unpin_version():
+    _pinned.version = None
+    _pinned.trace = None
+
+
+def start_trace() -> graph_trace.GraphTrace:
+    """Trace the lookups on Config.g of the current request until it is unpinned."""
+    _pinned.trace = graph_trace.GraphTrace()
+    return _pinned.trace
+
+
+def current_trace():
+    return getattr(_pinned, 'trace', None)
+
+
+def _publish(version: GraphVersion):
+    global _current
+    _current = version
+    _loaded.set()
+
+
+class PinnedGraph:
+    """
+    Stands in for Config.g and forwards every call to the graph of the version pinned by the current request.
+
+    This keeps every request on the graph it started with, even if a reload publishes a new version halfway through.
+    It is also where the lookups of a traced request are recorded, see start_trace().
+    """
+    __slots__ = ()
+
+    def __getattr__(self, item):
+        attribute = getattr(current_version().graph, item)
+        trace = getattr(_pinned, 'trace', None)
+        if trace is not None and item in graph_trace.TRACED_METHODS:
+            return trace.wrap(item, attribute)
+        return attribute
+
+    def _method(self, item):
+        return self.__getattr__(item)
+
+    def __iter__(self):
+        return self._method('__iter__')()
+
+    def __len__(self):
+        return self._method('__len__')()
+
+    def __contains__(self, triple):
+        return self._method('__contains__')(triple)
+
+
+Config.g = PinnedGraph()
+
+
+def _load_snapshot(digest: bytes):
+    try:
+        g = snapshot.read_snapshot(Config.snapshot_path, digest)
+        logger.info(f'Loaded snapshot from path {Config.snapshot_path}')
+        return g
+    except snapshot.InvalidSnapshot as e:
+        logger.info(f'Snapshot not used, falling back to Turtle. Reason: {e}')
+    except OSError:
+        traceback.print_exc()
+    return None
+
+
+def load_graph():
+    """Load the harvested data into a new GraphVersion. Returns None if the data could not be loaded."""
+    path = Config.data_path
     logger.info(f'Loading data from path {path}')
-    if os.path.isfile(path):
+    if not os.path.isfile(path):
+        return GraphVersion(Graph())
+
+    try:
+        modified = os.path.getmtime(path)
+        digest = snapshot.file_digest(path)
+    except OSError:
+        traceback.print_exc()
+        return None
+
+    g = triplestore.open_graph(digest)
+    if g is None:
+        g = _load_snapshot(digest)
+    if g is None:
+        g = Graph()
         try:
             g.parse(path, format='turtle')
             logger.info(f'Loading completed.')
         except Exception:
             traceback.print_exc()
-            # This block is only possible if load_graph() is triggered by watchdog.
             return None
-    if set_on_config:
-        Config.g = g
-    return g
+    return GraphVersion(g, digest, modified)
+
+
+class GraphReloader:
+    """
+    Loads new graph versions on a single background thread.
+
+    Reload requests that arrive while a load is running are coalesced into one follow-up load. A failed load leaves
+    the published version in place.
+    """
+    def __init__(self):
+        self._requested = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def request_reload(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='graph-reloader', daemon=True)
+                self._thread.start()
+        self._requested.set()
+
+    def _run(self):
+        # Started here rather than on import so the web process does not wait for watchdog, and before the first load
+        # so no change to the data is missed.
+        _watch_data()
+        while True:
+            self._requested.wait()
+            self._requested.clear()
+            self.reload()
+
+    @staticmethod
+    def reload():
+        start_time = time.time()
+        kind = 'reload' if _loaded.is_set() else 'initial'
+        try:
+            version = load_graph()
+        except Exception:
+            traceback.print_exc()
+            version = None
+
+        if version is None:
+            logger.error(f'Reload failed, keeping graph version {_current.number} ({_current.id}).')
+            metrics.GRAPH_LOAD_FAILURES.inc()
+            # Requests waiting for the first load should not wait forever on bad data.
+            _loaded.set()
+            return
+
+        _publish(version)
+        metrics.GRAPH_LOAD_SECONDS.observe(time.time() - start_time, kind=kind)
+        metrics.GRAPH_TRIPLES.set(len(version.graph))
+        metrics.GRAPH_LOADED.set(version.loaded_at)
+        logger.info(f'Published graph version {version.number} ({version.id}) with {len(version.graph)} triples '
+                    f'in {time.time() - start_time:.2f} seconds.')
+
+
+reloader = GraphReloader()
+_observer = None
+_WATCH_RETRY_SECONDS = 10
 
 
-def get_graph(config: Type[Config]):
-    if not hasattr(config, 'g'):
-        return load_graph()
-    else:
-        return config.g
+def _is_data_event(event):
+    path = getattr(event, 'dest_path', None) or event.src_path
+    return os.path.abspath(path) == os.path.abspath(Config.data_path)
+
+
+def _watch_data(retry=False):
+    """Reload the graph whenever the background task replaces the data file."""
+    global _observer
+    from watchdog.observers import Observer
+    directory = os.path.dirname(Config.data_path) or '.'
+    try:
+        # The web application may start before the background task has written anything.
+        os.makedirs(directory, exist_ok=True)
+        observer = Observer()
+        observer.schedule(VocviewFileSystemEventHandler(), directory)
+        observer.start()
+    except OSError:
+        logger.exception(f'Could not watch {directory} for new data, retrying in {_WATCH_RETRY_SECONDS} seconds.')
+        timer = threading.Timer(_WATCH_RETRY_SECONDS, _watch_data, kwargs={'retry': True})
+        timer.daemon = True
+        timer.start()
+        return
+    _observer = observer
+    if retry:
+        # The data may have changed while it was not watched.
+        reloader.request_reload()
+
+
+def stop_watching():
+    if _observer is not None:
+        _observer.stop()
 
 
 class VocviewFileSystemEventHandler(FileSystemEventHandler):
     def on_modified(self, event):
-        global last_trigger_time
-        current_time = time.time()
-        if event.src_path.find('~') == -1 and (current_time - last_trigger_time) > 1:
-            last_trigger_time = current_time
-            load_graph(set_on_config=True)
+        self._reload(event)
+
+    def on_moved(self, event):
+        # The background task replaces the data file atomically, which is reported as a move.
+        self._reload(event)
+
+    @staticmethod
+    def _reload(event):
+        if _is_data_event(event):
+            reloader.request_reload()
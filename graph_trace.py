@@ -0,0 +1,118 @@
+"""
+Opt-in tracing of the graph lookups a request makes through Config.g.
+
+With Config.graph_trace set, every lookup on Config.g during a request is counted and timed by the function that
+issued it, for example skos.get_description. Lookups that return generators are timed until the generator is used up or
+dropped. The totals of each request are reported in response headers, in the log or both. Many calls from the same
+getter on one page usually mean a lookup per child in a loop (an N+1 pattern) that could be answered from an index.
+
+Lookups on the graph of a GraphVersion directly, such as the ones building the SKOS index, are not traced.
+"""
+import logging
+import sys
+import time
+import types
+
+from flask import request
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Methods of rdflib.Graph that look up triples.
+TRACED_METHODS = frozenset((
+    'triples', 'triples_choices', 'objects', 'subjects', 'predicates', 'subject_objects', 'subject_predicates',
+    'predicate_objects', 'value', 'label', 'preferredLabel', 'items', 'transitive_objects', 'transitive_subjects',
+    'query', '__iter__', '__contains__', '__len__',
+))
+
+# Callers reported in the response header, most calls first.
+_HEADER_CALLERS = 10
+# A caller with at least this many calls of the same method on one request is logged as a likely N+1 pattern.
+N_PLUS_ONE_CALLS = 20
+
+# Modules whose frames are skipped when looking for the caller of a lookup.
+_SKIPPED_MODULES = ('graph_management', __name__)
+
+
+def _caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module not in _SKIPPED_MODULES and not module.startswith('rdflib'):
+            code = frame.f_code
+            return f'{module}.{getattr(code, "co_qualname", code.co_name)}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class GraphTrace:
+    def __init__(self):
+        # Count and seconds of calls by (caller, method).
+        self.calls = {}
+
+    def _record(self, key, seconds, count=0):
+        entry = self.calls.setdefault(key, [0, 0.0])
+        entry[0] += count
+        entry[1] += seconds
+
+    def _iterate(self, key, iterator):
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._record(key, time.perf_counter() - start)
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def wrap(self, method, function):
+        """Wrap a bound method of the graph so its calls are traced."""
+        def traced(*args, **kwargs):
+            key = (_caller(), method)
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self._record(key, time.perf_counter() - start, count=1)
+            if isinstance(result, types.GeneratorType):
+                return self._iterate(key, result)
+            return result
+        return traced
+
+    @property
+    def total_calls(self):
+        return sum(count for count, _ in self.calls.values())
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.calls.values())
+
+    def by_caller(self):
+        """(caller, method, count, seconds) tuples, most calls first."""
+        rows = [(caller, method, count, seconds) for (caller, method), (count, seconds) in self.calls.items()]
+        return sorted(rows, key=lambda row: (-row[2], -row[3]))
+
+    def report(self, response):
+        """Report the trace of the current request as configured by Config.graph_trace."""
+        mode = Config.graph_trace
+        rows = self.by_caller()
+        summary = f'{self.total_calls} calls; {self.total_seconds * 1000:.1f} ms'
+
+        if mode in ('header', 'all'):
+            response.headers['X-Graph-Trace'] = summary
+            response.headers['X-Graph-Trace-Callers'] = ', '.join(
+                f'{caller}:{method}={count};{seconds * 1000:.1f}ms'
+                for caller, method, count, seconds in rows[:_HEADER_CALLERS])
+
+        if mode in ('log', 'all'):
+            lines = [f'Graph trace of {request.method} {request.full_path}: {summary}']
+            for caller, method, count, seconds in rows:
+                flag = '  <- likely N+1' if count >= N_PLUS_ONE_CALLS else ''
+                lines.append(f'  {count:6} {seconds * 1000:9.1f} ms  {caller} {method}{flag}')
+            logger.info('\n'.join(lines))
+        return response
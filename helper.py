@@ -1,8 +1,6 @@
-from markdown import markdown
 from flask import url_for
 from rdflib.namespace import DCTERMS
 from rdflib import BNode, URIRef
-from bs4 import BeautifulSoup
 
 from config import Config
 # from triplestore import Triplestore
@@ -12,24 +10,6 @@ from urllib.parse import quote_plus
 from datetime import datetime, timedelta
 
 
-def render_concept_tree(html_doc):
-    soup = BeautifulSoup(html_doc, 'html.parser')
-
-    concept_hierarchy = soup.find(id='concept-hierarchy')
-
-    uls = concept_hierarchy.find_all('ul')
-
-    for i, ul in enumerate(uls):
-        # Don't add HTML class nested to the first 'ul' found.
-        if not i == 0:
-            ul['class'] = 'nested'
-            if ul.parent.name == 'li':
-                temp = BeautifulSoup(str(ul.parent.a.extract()), 'html.parser')
-                ul.parent.insert(0, BeautifulSoup('<span class="caret">', 'html.parser'))
-                ul.parent.span.insert(0, temp)
-    return soup
-
-
 # def get_triplestore_created_time():
 #     """Get the string message of the last time the local graph cache was created."""
 #
@@ -89,6 +69,8 @@ def render(text):
     if re.match(email_pattern, text):
         return '<p><a href="mailto:{0}">{0}</a></p>'.format(text)
 
+    # Imported on first use, as most pages never render Markdown.
+    from markdown import markdown
     return markdown(text)
 
 
@@ -0,0 +1,120 @@
+"""
+Validators for HTTP conditional requests.
+
+A page or RDF document is a function of the graph version and the request: its URL, including the host, and the headers
+used for content negotiation, and of the deployed code and templates. ETags are derived from those alone, so a request
+with a matching If-None-Match (or If-Modified-Since) is answered with a 304 before any rendering work.
+"""
+import functools
+import hashlib
+import os
+from datetime import datetime
+
+from flask import request, Response
+
+from config import Config
+
+# Routes whose responses only depend on the graph version and the request.
+CACHEABLE_ENDPOINTS = {
+    'routes.ob',
+    'routes.render_concept_register',
+    'routes.render_vocabulary_register',
+    'routes.download',
+    'routes.hierarchy_children',
+}
+
+
+# Directories of the application that hold code or templates which change the rendered responses.
+_CODE_DIRS = ('', 'controller', 'skos', 'templates')
+_CODE_SUFFIXES = ('.py', '.html')
+
+
+@functools.lru_cache(maxsize=None)
+def _code_state():
+    """A hash of the application version and the content of its code and templates, and their latest mtime."""
+    digest = hashlib.sha1(str(Config._version).encode('utf-8'))
+    modified = 0
+    for directory in _CODE_DIRS:
+        root = os.path.join(Config.APP_DIR, directory)
+        walk = os.walk(root) if directory else [(root, [], os.listdir(root))]
+        for path, dirs, files in walk:
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(_CODE_SUFFIXES):
+                    continue
+                file_path = os.path.join(path, name)
+                with open(file_path, 'rb') as f:
+                    digest.update(os.path.relpath(file_path, Config.APP_DIR).encode('utf-8'))
+                    digest.update(f.read())
+                modified = max(modified, os.path.getmtime(file_path))
+    return digest.hexdigest()[:16], modified
+
+
+def code_version() -> str:
+    """
+    Identifier of the deployed code and templates.
+
+    A redeploy with new templates or code but the same data changes it, so clients and the response cache do not keep
+    pages rendered by the previous release. Computed on first use rather than at start-up.
+    """
+    return _code_state()[0]
+
+
+def _is_cacheable():
+    return request.method in ('GET', 'HEAD') and request.endpoint in CACHEABLE_ENDPOINTS
+
+
+def etag(version) -> str:
+    key = '\n'.join((
+        code_version(),
+        # Pages link to the host and scheme they were requested with.
+        request.url_root,
+        request.full_path,
+        request.headers.get('Accept', ''),
+        'gzip' if 'gzip' in request.accept_encodings else '',
+    ))
+    return '{}-{}'.format(version.id[:16], hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+
+def last_modified(version):
+    if version.modified is None:
+        return None
+    # A redeploy is a modification too, for clients that only send If-Modified-Since.
+    modified = max(version.modified, _code_state()[1])
+    # HTTP dates have a resolution of one second.
+    return datetime.utcfromtimestamp(int(modified))
+
+
+def _set_validators(response, version, tag):
+    response.set_etag(tag)
+    modified = last_modified(version)
+    if modified is not None:
+        response.last_modified = modified
+    response.headers['Cache-Control'] = Config.cache_control
+    response.vary.add('Accept')
+
+
+def not_modified(version):
+    """A 304 response if the client's copy of the requested resource is current, otherwise None."""
+    if not _is_cacheable():
+        return None
+
+    tag = etag(version)
+    if request.if_none_match:
+        if not request.if_none_match.contains(tag):
+            return None
+    else:
+        modified = last_modified(version)
+        if modified is None or request.if_modified_since is None or request.if_modified_since < modified:
+            return None
+
+    response = Response(status=304)
+    _set_validators(response, version, tag)
+    return response
+
+
+def add_validators(response, version):
+    """Set ETag, Last-Modified and Cache-Control on a complete response of a cacheable route."""
+    if _is_cacheable() and response.status_code == 200 and not response.cache_control.no_store:
+        _set_validators(response, version, etag(version))
+    return response
@@ -0,0 +1,90 @@
+"""
+A SKOS-only alternative to the full OWL 2 RL closure.
+
+Only the entailments of the SKOS ontology (see local_vocabs/skos.ttl) that the viewer reads are materialised:
+
+- inverses: skos:broader/skos:narrower, skos:hasTopConcept/skos:topConceptOf, skos:broadMatch/skos:narrowMatch
+- sub-properties: skos:topConceptOf is a skos:inScheme, skos:broadMatch is a skos:broader and skos:narrowMatch is a
+  skos:narrower
+- symmetric and transitive mapping properties: skos:related, skos:relatedMatch, skos:closeMatch, skos:exactMatch
+- rdf:type skos:Concept, skos:ConceptScheme and skos:Collection from the domains and ranges of the properties above.
+  Like local_vocabs/skos.ttl, skos:broader and skos:narrower are not sub-properties of skos:semanticRelation here, so
+  external concepts that are only the target of a mapping are not typed as skos:Concept and stay out of the registers.
+
+Rules are applied by forward chaining: every triple with a rule predicate goes through a worklist once and each rule
+only looks up the triples it joins with through the graph's indexes. No axiomatic triples are added.
+"""
+from rdflib import Graph, BNode, URIRef
+from rdflib.namespace import RDF, SKOS
+
+INVERSE = {
+    SKOS.broader: SKOS.narrower,
+    SKOS.narrower: SKOS.broader,
+    SKOS.hasTopConcept: SKOS.topConceptOf,
+    SKOS.topConceptOf: SKOS.hasTopConcept,
+    SKOS.broadMatch: SKOS.narrowMatch,
+    SKOS.narrowMatch: SKOS.broadMatch,
+}
+
+SUPER_PROPERTY = {
+    SKOS.topConceptOf: SKOS.inScheme,
+    SKOS.broadMatch: SKOS.broader,
+    SKOS.narrowMatch: SKOS.narrower,
+}
+
+SYMMETRIC = {SKOS.related, SKOS.relatedMatch, SKOS.closeMatch, SKOS.exactMatch}
+
+TRANSITIVE = {SKOS.exactMatch}
+
+DOMAIN = {
+    SKOS.related: SKOS.Concept,
+    SKOS.hasTopConcept: SKOS.ConceptScheme,
+    SKOS.topConceptOf: SKOS.Concept,
+    SKOS.member: SKOS.Collection,
+}
+
+RANGE = {
+    SKOS.related: SKOS.Concept,
+    SKOS.hasTopConcept: SKOS.Concept,
+    SKOS.topConceptOf: SKOS.ConceptScheme,
+    SKOS.inScheme: SKOS.ConceptScheme,
+}
+
+RULE_PREDICATES = set(INVERSE) | set(SUPER_PROPERTY) | SYMMETRIC | TRANSITIVE | set(DOMAIN) | set(RANGE)
+
+
+def _consequences(g, s, p, o):
+    if p in INVERSE:
+        yield o, INVERSE[p], s
+    if p in SUPER_PROPERTY:
+        yield s, SUPER_PROPERTY[p], o
+    if p in SYMMETRIC:
+        yield o, p, s
+    if p in TRANSITIVE:
+        for z in g.objects(o, p):
+            yield s, p, z
+        for w in g.subjects(p, s):
+            yield w, p, o
+    if p in DOMAIN:
+        yield s, RDF.type, DOMAIN[p]
+    if p in RANGE and isinstance(o, (URIRef, BNode)):
+        yield o, RDF.type, RANGE[p]
+
+
+def expand(g: Graph) -> int:
+    """
+    Materialise the SKOS entailments in place.
+
+    :return: The number of triples added.
+    """
+    worklist = [triple for p in RULE_PREDICATES for triple in g.triples((None, p, None))]
+    added = 0
+    while worklist:
+        s, p, o = worklist.pop()
+        for triple in list(_consequences(g, s, p, o)):
+            if triple not in g:
+                g.add(triple)
+                added += 1
+                if triple[1] in RULE_PREDICATES:
+                    worklist.append(triple)
+    return added
@@ -0,0 +1,93 @@
+"""
+Persistent cache of labels fetched by dereferencing external URIs.
+
+The cache is a SQLite database in the data directory, so it is shared by all web workers and kept across restarts.
+Entries expire after a TTL, failed lookups are cached for a shorter TTL and the least recently used entries are evicted
+once the cache grows past its maximum size.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from rdflib import Literal, URIRef
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Only record an access on a hit if the previous one is older than this, to keep hits read-only most of the time.
+_ACCESS_RESOLUTION_SECONDS = 60
+
+
+class LabelCache:
+    def __init__(self, path, max_entries, ttl, negative_ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS labels ('
+                         'uri TEXT PRIMARY KEY, value TEXT, language TEXT, datatype TEXT, '
+                         'expires REAL NOT NULL, accessed REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS labels_accessed ON labels (accessed)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, uri):
+        """
+        Look up a cached label.
+
+        :return: A tuple (hit, label). label is None for a cached failure.
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute('SELECT value, language, datatype, expires, accessed FROM labels WHERE uri = ?',
+                               (str(uri),)).fetchone()
+            if row is None or row[3] < now:
+                return False, None
+            if now - row[4] > _ACCESS_RESOLUTION_SECONDS:
+                conn.execute('UPDATE labels SET accessed = ? WHERE uri = ?', (now, str(uri)))
+        except sqlite3.Error as e:
+            logger.warning(f'Label cache unavailable: {e}')
+            return False, None
+
+        value, language, datatype, _, _ = row
+        if value is None:
+            return True, None
+        return True, Literal(value, lang=language, datatype=URIRef(datatype) if datatype else None)
+
+    def put(self, uri, label):
+        """Cache a label. A label of None records a failed lookup."""
+        now = time.time()
+        if label is None:
+            row = (str(uri), None, None, None, now + self.negative_ttl, now)
+        else:
+            datatype = getattr(label, 'datatype', None)
+            row = (str(uri), str(label), getattr(label, 'language', None), str(datatype) if datatype else None,
+                   now + self.ttl, now)
+        try:
+            conn = self._connection()
+            conn.execute('INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?, ?)', row)
+            self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f'Label cache unavailable: {e}')
+
+    def _evict(self, conn):
+        count = conn.execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+        if count > self.max_entries:
+            # Evict a little more than necessary so that eviction does not run on every insert.
+            excess = count - self.max_entries + max(1, self.max_entries // 10)
+            conn.execute('DELETE FROM labels WHERE uri IN (SELECT uri FROM labels ORDER BY accessed LIMIT ?)',
+                         (excess,))
+
+
+cache = LabelCache(Config.label_cache_path, Config.label_cache_max_entries, Config.label_cache_ttl,
+                   Config.label_cache_negative_ttl)
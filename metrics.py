@@ -0,0 +1,377 @@
+"""
+Prometheus metrics of the web workers and the background task, served by /metrics.
+
+Each process keeps its metrics in memory and writes them to a file of its own in Config.metrics_dir, at most every
+few seconds. /metrics merges the files of all processes. Counters and histograms are summed, including those of
+processes that have exited so that totals never go backwards. The files of exited processes are folded into a single
+file on merge. Gauges are the maximum over the processes still running. A process holds a lock on a file next to its
+metrics file for as long as it runs, which tells a running process from an exited one whose PID was reused.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import g, request
+from rdflib import URIRef
+from rdflib.namespace import SKOS
+
+from config import Config
+import snapshot
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds between writes of a process's metrics file.
+_FLUSH_SECONDS = 5
+
+# Counters and histograms of exited processes, and the lock taken while they are folded into it.
+_EXITED_FILE = 'exited.json'
+_MERGE_LOCK_FILE = 'merge.lock'
+
+# Upper bounds of the histogram buckets, in seconds.
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOAD_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class _Process:
+    """The metric values of this process and the file they are written to."""
+    def __init__(self):
+        self.pid = os.getpid()
+        self.name = f'{self.pid}-{int(time.time() * 1000)}'
+        self.path = None
+        if Config.metrics_dir:
+            self.path = os.path.join(Config.metrics_dir, self.name + '.json')
+        # Open, and locked, from the first flush until the process exits.
+        self.liveness_file = None
+        self.lock = threading.Lock()
+        self.values = {}
+        self.dirty = False
+        self.flusher = None
+
+
+_process = _Process()
+_registry = {}
+
+
+def _current_process():
+    global _process
+    if _process.pid != os.getpid():
+        # A forked child must not count the values it inherited from its parent a second time.
+        _process = _Process()
+    return _process
+
+
+def _mark_dirty(process):
+    process.dirty = True
+    if process.path and process.flusher is None:
+        process.flusher = threading.Thread(target=_flush_periodically, args=(process,), name='metrics-flusher',
+                                           daemon=True)
+        process.flusher.start()
+
+
+def _flush_periodically(process):
+    while process is _process:
+        time.sleep(_FLUSH_SECONDS)
+        if process.dirty:
+            flush()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _update(self, labels, update):
+        process = _current_process()
+        with process.lock:
+            values = process.values.setdefault(self.name, {})
+            key = self._key(labels)
+            values[key] = update(values.get(key))
+            _mark_dirty(process)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+    def merge(self, values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self._update(labels, lambda _: value)
+
+    def merge(self, values, other):
+        for key, value in other.items():
+            values[key] = max(values.get(key, value), value)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        def update(counts):
+            # Non-cumulative bucket counts, then the +Inf bucket, the sum and the count.
+            counts = counts or [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+            return counts
+        self._update(labels, update)
+
+    def merge(self, values, other):
+        for key, counts in other.items():
+            merged = values.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(counts):
+                merged[i] += count
+
+
+REQUEST_SECONDS = Histogram(
+    'vocview_request_duration_seconds', 'Time to build the response to a request, by route. ob requests are split by '
+    'the SKOS type of the resource.', ('route', 'skos_type', 'status'))
+GRAPH_LOAD_SECONDS = Histogram(
+    'vocview_graph_load_duration_seconds', 'Time to load and index a graph version, initial load or reload.',
+    ('kind',), LOAD_BUCKETS)
+GRAPH_LOAD_FAILURES = Counter('vocview_graph_load_failures_total', 'Graph loads that failed.')
+GRAPH_TRIPLES = Gauge('vocview_graph_triples', 'Triples in the published graph version.')
+GRAPH_LOADED = Gauge('vocview_graph_loaded_timestamp_seconds', 'When the published graph version was loaded.')
+HARVEST_STAGE_SECONDS = Histogram(
+    'vocview_harvest_stage_duration_seconds', 'Time of the stages of the background task: harvest, reasoner, write.',
+    ('stage',), LOAD_BUCKETS)
+HARVEST_FETCH_SECONDS = Histogram(
+    'vocview_harvest_fetch_duration_seconds', 'Time to fetch a download source, by outcome (downloaded, '
+    'not_modified, unchanged, failed).', ('source', 'outcome'), LOAD_BUCKETS)
+HARVEST_PARSE_SECONDS = Histogram(
+    'vocview_harvest_parse_duration_seconds', 'Time to parse a download source.', ('source',), LOAD_BUCKETS)
+LABEL_CACHE_REQUESTS = Counter(
+    'vocview_label_cache_requests_total', 'Lookups of labels of external URIs in the label cache, by result.',
+    ('result',))
+LABEL_DEREFERENCE_SECONDS = Histogram(
+    'vocview_label_dereference_duration_seconds', 'Time to dereference an external URI for its label, by whether a '
+    'label was found.', ('outcome',))
+RESPONSE_CACHE_REQUESTS = Counter(
+    'vocview_response_cache_requests_total', 'Lookups in the cache of rendered pages, by result (hit, disk_hit, '
+    'miss).', ('result',))
+RESPONSE_CACHE_EVICTIONS = Counter('vocview_response_cache_evictions_total', 'Pages evicted from the memory cache.')
+
+
+def _serialize(process):
+    with process.lock:
+        return json.dumps({name: [[list(key), value] for key, value in values.items()]
+                           for name, values in process.values.items()})
+
+
+def flush():
+    """Write this process's metrics to its file."""
+    process = _current_process()
+    if not process.path:
+        return
+    process.dirty = False
+    data = _serialize(process)
+    try:
+        os.makedirs(Config.metrics_dir, exist_ok=True)
+        if process.liveness_file is None:
+            liveness_file = open(_liveness_path(process.name), 'a')
+            fcntl.flock(liveness_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            process.liveness_file = liveness_file
+        snapshot.write_atomic(process.path, data.encode('utf-8'))
+    except OSError as e:
+        logger.warning(f'Could not write metrics to {process.path}: {e}')
+
+
+atexit.register(flush)
+
+
+def _liveness_path(name):
+    return os.path.join(Config.metrics_dir, name + '.lock')
+
+
+def _is_alive(name):
+    """True if the process that writes the metrics file name.json is still running."""
+    try:
+        with open(_liveness_path(name), 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        # Locked by the running process, or cannot tell.
+        return True
+    return False
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(merged, data, gauges=True):
+    for name, values in data.items():
+        metric = _registry.get(name)
+        if metric is None or (metric.type == 'gauge' and not gauges):
+            continue
+        metric.merge(merged.setdefault(name, {}), {tuple(key): value for key, value in values})
+
+
+def _serialize_merged(merged):
+    return {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}
+
+
+def _fold_exited():
+    """
+    Fold the counters and histograms of exited processes into the exited file and remove their files.
+
+    The exited file lists the processes folded into it until their files are gone, so a merge interrupted between
+    writing it and removing the files does not count them twice.
+
+    :return: The contents of the exited file.
+    """
+    directory = Config.metrics_dir
+    exited_path = os.path.join(directory, _EXITED_FILE)
+    with open(os.path.join(directory, _MERGE_LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = _read(exited_path) or {'processes': [], 'metrics': {}}
+        folded = set(exited['processes'])
+        names = {file_name[:-len('.json')] for file_name in os.listdir(directory)
+                 if file_name.endswith('.json') and file_name != _EXITED_FILE}
+        dead = {name for name in names - folded if not _is_alive(name)}
+
+        if dead:
+            merged = {}
+            _merge(merged, exited['metrics'])
+            for name in dead:
+                data = _read(os.path.join(directory, name + '.json'))
+                if data is not None:
+                    _merge(merged, data, gauges=False)
+            exited = {'processes': sorted(folded | dead), 'metrics': _serialize_merged(merged)}
+            snapshot.write_atomic(exited_path, json.dumps(exited).encode('utf-8'))
+
+        for name in folded | dead:
+            for path in (os.path.join(directory, name + '.json'), _liveness_path(name)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        if exited['processes']:
+            exited['processes'] = []
+            snapshot.write_atomic(exited_path, json.dumps(exited).encode('utf-8'))
+    return exited
+
+
+def _collect():
+    """The merged values of all processes by metric name."""
+    merged = {}
+    process = _current_process()
+    if not process.path:
+        _merge(merged, json.loads(_serialize(process)))
+        return merged
+
+    flush()
+    try:
+        exited = _fold_exited()
+    except OSError as e:
+        logger.warning(f'Could not fold the metrics of exited processes: {e}')
+        exited = {'processes': [], 'metrics': {}}
+    _merge(merged, exited['metrics'])
+    for file_name in os.listdir(Config.metrics_dir):
+        name = file_name[:-len('.json')]
+        if not file_name.endswith('.json') or file_name == _EXITED_FILE or name in exited['processes']:
+            continue
+        data = _read(os.path.join(Config.metrics_dir, file_name))
+        if data is not None:
+            _merge(merged, data, gauges=_is_alive(name))
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    merged = _collect()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.type != 'histogram':
+                lines.append(f'{name}{_labels(metric.labelnames, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, key, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, key)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _skos_type(version):
+    uri = (request.view_args or {}).get('uri')
+    if uri is None:
+        return ''
+    types = version.index.types.get(URIRef(uri), ())
+    for class_type in (SKOS.Concept, SKOS.ConceptScheme, SKOS.Collection):
+        if class_type in types:
+            return class_type.split('#')[-1]
+    return 'other'
+
+
+def observe_request(response, version):
+    """Record the duration of the current request, started by start_request()."""
+    start = g.pop('metrics_start', None)
+    if start is None or request.endpoint == 'routes.metrics_endpoint':
+        return response
+    endpoint = request.endpoint or 'none'
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        route=endpoint.split('.')[-1],
+        skos_type=_skos_type(version) if endpoint == 'routes.ob' else '',
+        status=response.status_code,
+    )
+    return response
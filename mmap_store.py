@@ -0,0 +1,246 @@
+"""
+A read-only rdflib store backed by a memory-mapped file.
+
+The background task writes the graph once into a compact binary file. Every web worker maps the same file read-only,
+so the operating system keeps a single copy of its pages in memory however many workers there are.
+
+File layout (native byte order, all sections 8-byte aligned):
+    header | term offsets (uint64, term count + 1) | term bytes | namespaces (JSON) | SPO | POS | OSP
+
+Terms are encoded as a kind byte followed by UTF-8 text and sorted by their encoding, so a term is found by binary
+search. Each of SPO, POS and OSP holds every triple as three uint32 term ids, sorted in that order, so any triple
+pattern is answered by binary search over one of them.
+
+Like a snapshot, the file records the SHA-256 of the Turtle file it was written from and is only used when that
+matches.
+"""
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.store import Store
+
+import snapshot
+
+MAGIC = b'VOCVIEW-MMAP'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('={}sH32s32sQQQQ'.format(len(MAGIC)))
+
+# Decoded terms kept per process. Bounded so that the workers do not each build a copy of the whole term table.
+_TERM_CACHE_SIZE = 100000
+
+# Permutations of (s, p, o): the order of the ids in a row, and where s, p and o are in a row.
+_SPO, _POS, _OSP = 0, 1, 2
+_ORDERS = ((0, 1, 2), (1, 2, 0), (2, 0, 1))
+_POSITIONS = ((0, 1, 2), (2, 0, 1), (1, 2, 0))
+
+
+class InvalidStoreFile(Exception):
+    pass
+
+
+def encode_term(term) -> bytes:
+    if isinstance(term, URIRef):
+        return b'U' + term.encode('utf-8')
+    if isinstance(term, BNode):
+        return b'B' + term.encode('utf-8')
+    if isinstance(term, Literal):
+        if term.language:
+            return b'l' + '{}\0{}'.format(term, term.language).encode('utf-8')
+        if term.datatype:
+            return b'D' + '{}\0{}'.format(term, term.datatype).encode('utf-8')
+        return b'L' + term.encode('utf-8')
+    raise TypeError(f'Cannot store term {term!r}')
+
+
+def decode_term(data: bytes):
+    kind, text = data[:1], data[1:].decode('utf-8')
+    if kind == b'U':
+        return URIRef(text)
+    if kind == b'L':
+        return Literal(text)
+    if kind == b'B':
+        return BNode(text)
+    # The language tag or datatype never contains a NUL, the lexical form might.
+    lexical, _, extra = text.rpartition('\0')
+    if kind == b'l':
+        return Literal(lexical, lang=extra)
+    return Literal(lexical, datatype=URIRef(extra))
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 8)
+
+
+def write(g: Graph, path: str, source_digest: bytes):
+    """Write the graph to a store file at path."""
+    terms = sorted({encode_term(term) for triple in g for term in triple})
+    ids = {term: i for i, term in enumerate(terms)}
+
+    offsets = array('Q', [0])
+    for term in terms:
+        offsets.append(offsets[-1] + len(term))
+
+    rows = [(ids[encode_term(s)], ids[encode_term(p)], ids[encode_term(o)]) for s, p, o in g]
+    permutations = []
+    for order in _ORDERS:
+        permuted = sorted(tuple(row[i] for i in order) for row in rows)
+        permutations.append(_pad(array('I', (i for row in permuted for i in row)).tobytes()))
+
+    namespaces = json.dumps({prefix: str(namespace) for prefix, namespace in g.namespaces()}).encode('utf-8')
+    sections = [offsets.tobytes(), _pad(b''.join(terms)), _pad(namespaces)] + permutations
+    payload = b''.join(sections)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, source_digest, snapshot.digest_bytes(payload), len(terms), len(rows),
+                          len(namespaces), offsets[-1])
+    snapshot.write_atomic(path, _pad(header) + payload)
+
+
+class _Rows:
+    """The first width ids of every row of a permutation, as a sorted sequence for bisect."""
+    def __init__(self, ids, width):
+        self.ids = ids
+        self.width = width
+
+    def __len__(self):
+        return len(self.ids) // 3
+
+    def __getitem__(self, i):
+        return tuple(self.ids[3 * i:3 * i + self.width])
+
+
+class MmapStore(Store):
+    """Read-only store over a file written by write(). Namespace bindings made at runtime are kept in memory only."""
+    context_aware = False
+    formula_aware = False
+    graph_aware = False
+
+    def __init__(self, path, source_digest: bytes = None):
+        super().__init__()
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buffer = memoryview(self._mmap)
+        if len(buffer) < _HEADER.size:
+            raise InvalidStoreFile('Store file is truncated')
+        magic, version, file_source_digest, payload_digest, term_count, triple_count, namespaces_length, \
+            terms_length = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise InvalidStoreFile('Unknown store file format')
+        if source_digest is not None and file_source_digest != source_digest:
+            raise InvalidStoreFile('Store file is stale')
+
+        start = _HEADER.size + (-_HEADER.size % 8)
+        if snapshot.digest_bytes(buffer[start:]) != payload_digest:
+            raise InvalidStoreFile('Store file checksum mismatch')
+
+        def section(length):
+            nonlocal start
+            view = buffer[start:start + length]
+            start += length + (-length % 8)
+            return view
+
+        self._offsets = section((term_count + 1) * 8).cast('Q')
+        self._terms_start = start
+        section(terms_length)
+        self._namespaces = {prefix: URIRef(namespace)
+                            for prefix, namespace in json.loads(bytes(section(namespaces_length))).items()}
+        self._permutations = [section(triple_count * 12).cast('I') for _ in _ORDERS]
+        self._triple_count = triple_count
+        self._term = lru_cache(maxsize=_TERM_CACHE_SIZE)(self._read_term)
+
+    def _term_bytes(self, i):
+        return self._mmap[self._terms_start + self._offsets[i]:self._terms_start + self._offsets[i + 1]]
+
+    def _read_term(self, i):
+        return decode_term(self._term_bytes(i))
+
+    def _term_id(self, term):
+        """The id of a term, or None if it is not in the store."""
+        try:
+            encoded = encode_term(term)
+        except TypeError:
+            return None
+        lo, hi = 0, len(self._offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._offsets) - 1 and self._term_bytes(lo) == encoded:
+            return lo
+        return None
+
+    def triples(self, triple_pattern, context=None):
+        pattern = []
+        for term in triple_pattern:
+            if term is None:
+                pattern.append(None)
+            else:
+                term_id = self._term_id(term)
+                if term_id is None:
+                    return
+                pattern.append(term_id)
+        s, p, o = pattern
+
+        # Pick the permutation whose order starts with the bound positions.
+        if s is not None:
+            permutation, key = (_OSP, (o, s)) if p is None and o is not None else (_SPO, (s, p, o))
+        elif p is not None:
+            permutation, key = _POS, (p, o, s)
+        elif o is not None:
+            permutation, key = _OSP, (o, s, p)
+        else:
+            permutation, key = _SPO, ()
+        key = key[:key.index(None)] if None in key else key
+
+        ids = self._permutations[permutation]
+        rows = _Rows(ids, len(key))
+        lo = bisect_left(rows, key) if key else 0
+        hi = bisect_right(rows, key, lo) if key else len(rows)
+        s_index, p_index, o_index = _POSITIONS[permutation]
+        for i in range(lo, hi):
+            row = ids[3 * i:3 * i + 3]
+            yield (self._term(row[s_index]), self._term(row[p_index]), self._term(row[o_index])), iter(())
+
+    def __len__(self, context=None):
+        return self._triple_count
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError('The memory-mapped store is read-only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('The memory-mapped store is read-only')
+
+    def bind(self, prefix, namespace):
+        self._namespaces[prefix] = URIRef(namespace)
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        for prefix, bound in self._namespaces.items():
+            if bound == namespace:
+                return prefix
+        return None
+
+    def namespaces(self):
+        return iter(list(self._namespaces.items()))
+
+
+def open_graph(path: str, source_digest: bytes) -> Graph:
+    if not os.path.isfile(path):
+        raise InvalidStoreFile(f'No store file at path {path}')
+    try:
+        return Graph(store=MmapStore(path, source_digest))
+    except (ValueError, struct.error) as e:
+        raise InvalidStoreFile(f'Store file could not be read: {e}')
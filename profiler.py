@@ -0,0 +1,185 @@
+"""
+On-demand sampling profiler for single requests.
+
+A concept, concept scheme, collection or register request that carries Config.profile_secret in the X-Profile header
+or the _profile query parameter is run under a sampling profiler. A background thread records the stack of the request
+thread at a fixed interval. The profile is written to Config.profile_dir as a speedscope file
+(https://www.speedscope.app) or as collapsed stacks for flamegraph.pl, next to a JSON file with the request URL, the
+graph version and the timing. The response names the files in an X-Profile header.
+
+Without the secret configured, the only cost per request is checking that it is empty.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from flask import g, request
+
+from config import Config
+import snapshot
+
+logger = logging.getLogger(__name__)
+
+PROFILED_ENDPOINTS = {
+    'routes.ob',
+    'routes.render_concept_register',
+    'routes.render_vocabulary_register',
+}
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread."""
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        # (stack, seconds) pairs in the order they were taken. A stack is a tuple of frames, outermost first.
+        self.samples = []
+        self.started = None
+        self.duration = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    @staticmethod
+    def _frame(frame):
+        code = frame.f_code
+        return getattr(code, 'co_qualname', code.co_name), code.co_filename, code.co_firstlineno
+
+    def _run(self):
+        last = self.started
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None or self._stop.is_set():
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame(frame))
+                frame = frame.f_back
+            self.samples.append((tuple(reversed(stack)), now - last))
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def collapsed(self):
+        """Stacks in the collapsed format of flamegraph.pl, one line of frames and sample count per stack."""
+        counts = {}
+        for stack, _ in self.samples:
+            key = ';'.join(f'{name} ({os.path.basename(path)}:{line})'.replace(';', ':') for name, path, line in stack)
+            counts[key] = counts.get(key, 0) + 1
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(counts.items()))
+
+    def speedscope(self, name):
+        frames = []
+        frame_index = {}
+        samples = []
+        for stack, _ in self.samples:
+            sample = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(frame_index[frame])
+            samples.append(sample)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'vocview',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self.duration,
+                'samples': samples,
+                'weights': [seconds for _, seconds in self.samples],
+            }],
+        }
+
+
+def _requested():
+    secret = request.headers.get('X-Profile') or request.args.get('_profile')
+    return secret is not None and request.endpoint in PROFILED_ENDPOINTS \
+        and hmac.compare_digest(secret.encode('utf-8'), Config.profile_secret.encode('utf-8'))
+
+
+def _url():
+    """The path and query string of the current request, without the secret."""
+    args = [(key, value) for key, value in request.args.items(multi=True) if key != '_profile']
+    return request.path + ('?' + urlencode(args) if args else '')
+
+
+def start():
+    """Start profiling the current request if it asks for it. Returns True if it is profiled."""
+    if not Config.profile_secret or not _requested():
+        return False
+    # Kept after finish(), whether or not the profile could be written, so that the response is not cached.
+    g.profiled = True
+    g.profiler = SamplingProfiler(threading.get_ident(), Config.profile_interval)
+    g.profiler.start()
+    return True
+
+
+def is_profiled():
+    """True if the current request was run under the profiler."""
+    return g.get('profiled', False)
+
+
+def finish(response, version):
+    """Stop profiling the current request, if it is profiled, and write the profile."""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.stop()
+
+    url = _url()
+    name = '{}-{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), request.endpoint.split('.')[-1],
+                             hashlib.sha1(url.encode('utf-8')).hexdigest()[:8])
+    metadata = {
+        'url': url,
+        'uri': (request.view_args or {}).get('uri'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'graph_version': version.id,
+        'graph_version_number': version.number,
+        'seconds': profiler.duration,
+        'samples': len(profiler.samples),
+        'interval': profiler.interval,
+        'created': time.time(),
+    }
+    if Config.profile_format == 'collapsed':
+        profile_name = name + '.collapsed'
+        data = profiler.collapsed().encode('utf-8')
+    else:
+        profile_name = name + '.speedscope.json'
+        title = f'{url} (graph version {version.id[:12]}, {profiler.duration:.3f} s)'
+        data = json.dumps(profiler.speedscope(title)).encode('utf-8')
+    metadata['profile'] = profile_name
+
+    try:
+        os.makedirs(Config.profile_dir, exist_ok=True)
+        snapshot.write_atomic(os.path.join(Config.profile_dir, profile_name), data)
+        snapshot.write_atomic(os.path.join(Config.profile_dir, name + '.json'),
+                              json.dumps(metadata, indent=2).encode('utf-8'))
+    except OSError as e:
+        logger.warning(f'Could not write profile {profile_name}: {e}')
+        return response
+
+    logger.info(f'Profiled {url} in {profiler.duration:.3f} seconds, {len(profiler.samples)} samples '
+                f'written to {profile_name}')
+    response.headers['X-Profile'] = profile_name
+    return response
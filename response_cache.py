@@ -0,0 +1,232 @@
+"""
+Cache of rendered concept, concept scheme and collection pages.
+
+A rendered page only depends on the graph version, the deployed code and the request (see http_cache.etag()), so
+responses are cached by those. Entries live in memory, least recently used first out once the cache is over its size
+budget. With a cache directory configured, they are also written to disk where every worker can read them, the oldest
+removed first once the directory is over its own budget. Entries of older graph versions or of a previous release are
+dropped as soon as a newer version is seen.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+
+from flask import request, Response
+
+from config import Config
+import http_cache
+import metrics
+import profiler
+import snapshot
+
+logger = logging.getLogger(__name__)
+
+CACHED_ENDPOINTS = {'routes.ob'}
+
+# Headers that are not replayed from the cache.
+_SKIP_HEADERS = {'content-length', 'set-cookie', 'x-cache'}
+
+# Rough per-entry overhead in bytes of the key, the headers and the bookkeeping, counted against the budget.
+_ENTRY_OVERHEAD = 512
+
+# Writes to the disk tier between measurements of its size. Other workers write to it too, so the size this worker has
+# written is only an estimate in between.
+_DISK_CHECK_WRITES = 64
+
+
+def _directory_name(version):
+    # Pages on disk may have been pickled by a previous release with other templates.
+    return f'{version.id}-{http_cache.code_version()}'
+
+
+class ResponseCache:
+    def __init__(self, max_bytes, directory=None, max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        # A single page larger than this would evict a large part of the cache, so it is not cached in memory.
+        self.max_entry_bytes = max_bytes // 8
+        self.directory = directory or None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version_number = 0
+        self._disk_bytes = 0
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _switch_version(self, version):
+        """Drop everything cached for older versions. Returns False if version is older than the cached one."""
+        if version.number < self._version_number:
+            return False
+        if version.number > self._version_number:
+            self._version_number = version.number
+            self._entries.clear()
+            self._size = 0
+            self._disk_bytes = 0
+            self._disk_writes = 0
+            if self.directory:
+                self._remove_old_directories(_directory_name(version))
+        return True
+
+    def _remove_old_directories(self, current):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _path(self, version, key):
+        return os.path.join(self.directory, _directory_name(version), hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _put_memory(self, key, entry):
+        size = len(entry[2]) + _ENTRY_OVERHEAD
+        if size > self.max_entry_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old[2]) + _ENTRY_OVERHEAD
+        self._entries[key] = entry
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted[2]) + _ENTRY_OVERHEAD
+            self.evictions += 1
+            metrics.RESPONSE_CACHE_EVICTIONS.inc()
+
+    def get(self, version, key):
+        """
+        Look up a cached response.
+
+        :return: A tuple (status, headers, body) or None.
+        """
+        with self._lock:
+            if not self._switch_version(version):
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.RESPONSE_CACHE_REQUESTS.inc(result='hit')
+                return entry
+
+        if self.directory:
+            try:
+                with open(self._path(version, key), 'rb') as f:
+                    entry = pickle.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f'Could not read cached response for {key!r}: {e}')
+            else:
+                metrics.RESPONSE_CACHE_REQUESTS.inc(result='disk_hit')
+                with self._lock:
+                    self.disk_hits += 1
+                    if self._switch_version(version):
+                        self._put_memory(key, entry)
+                return entry
+
+        metrics.RESPONSE_CACHE_REQUESTS.inc(result='miss')
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, version, key, entry):
+        with self._lock:
+            if not self._switch_version(version):
+                return
+            self._put_memory(key, entry)
+
+        if self.directory:
+            path = self._path(version, key)
+            data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                self._disk_bytes += len(data)
+                self._disk_writes += 1
+                trim = self._disk_bytes > self.max_disk_bytes or self._disk_writes % _DISK_CHECK_WRITES == 0
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                snapshot.write_atomic(path, data)
+                if trim:
+                    self._trim_disk(os.path.dirname(path))
+            except OSError as e:
+                logger.warning(f'Could not write cached response for {key!r}: {e}')
+
+    def _trim_disk(self, directory):
+        """Remove the least recently written pages of a version until the disk tier is within its budget."""
+        entries = []
+        total = 0
+        for entry in os.scandir(directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total > self.max_disk_bytes:
+            entries.sort()
+            # Down to 90 % of the budget, so that the next few writes do not trim again.
+            for _, size, path in entries:
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+
+cache = ResponseCache(Config.response_cache_max_bytes, Config.response_cache_dir, Config.response_cache_dir_max_bytes)
+
+
+def _is_cached_endpoint():
+    return cache.max_bytes > 0 and request.method in ('GET', 'HEAD') and request.endpoint in CACHED_ENDPOINTS
+
+
+def cached_response(version):
+    """The cached response to the current request, or None."""
+    if not _is_cached_endpoint():
+        return None
+    entry = cache.get(version, http_cache.etag(version))
+    if entry is None:
+        return None
+    status, headers, body = entry
+    response = Response(body, status=status, headers=headers)
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+
+def store(response, version):
+    """Cache a complete response to the current request."""
+    if not _is_cached_endpoint() or request.method != 'GET' or 'X-Cache' in response.headers:
+        return response
+    # Profiled responses (see profiler.py) may carry the profiling secret in their URL.
+    if profiler.is_profiled():
+        return response
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return response
+
+    headers = [(name, value) for name, value in response.headers if name.lower() not in _SKIP_HEADERS]
+    cache.put(version, http_cache.etag(version), (response.status_code, headers, response.get_data()))
+    response.headers['X-Cache'] = 'MISS'
+    return response
@@ -1,20 +1,46 @@
 from rdflib.namespace import RDF, SKOS, DCTERMS, RDFS, OWL, DC
 from rdflib import URIRef, Namespace, Literal, Graph
-import markdown
-from flask import url_for
-import requests
+from flask import url_for, request
 
 from config import Config
-from skos.concept_scheme import ConceptScheme, ConceptSchemeRenderer
-from skos.concept import Concept, ConceptRenderer
-from skos.collection import CollectionRenderer, Collection
-from skos.register import Register
+import graph_management
 import helper
+import label_cache
+import metrics
 
+import importlib
+import logging
+import threading
+import time
 from datetime import date
+from html import escape
+from itertools import chain
 from urllib import parse
 
 
+logger = logging.getLogger(__name__)
+
+# The page classes and their renderers, imported on first use so that starting the web process does not import pyldapi.
+_LAZY_ATTRIBUTES = {
+    'ConceptScheme': 'skos.concept_scheme',
+    'ConceptSchemeRenderer': 'skos.concept_scheme',
+    'Concept': 'skos.concept',
+    'ConceptRenderer': 'skos.concept',
+    'Collection': 'skos.collection',
+    'CollectionRenderer': 'skos.collection',
+    'Register': 'skos.register',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
 # Controlled values
 CONCEPT = 0
 CONCEPTSCHEME = 1
@@ -23,22 +49,39 @@ METHOD = 3
 
 SCHEMAORG = Namespace('http://schema.org/')
 
+METHOD_CLASS = URIRef('https://w3id.org/tern/ontologies/tern/Method')
+
+
+def _index():
+    """The SkosIndex of the graph version pinned by the current request."""
+    return graph_management.current_version().index
+
 
 def list_concepts():
-    concepts = []
-    for c in Config.g.subjects(RDF.type, SKOS.Concept):
-        label = get_label(c)
+    """All concepts as (uri, label) pairs sorted by label, see concept_register_items()."""
+    return _index().concepts
+
+
+def search_concepts(query):
+    """Concepts matching the search query as (uri, label) pairs, best match first."""
+    return graph_management.current_version().concept_search.search(query)
+
+
+def concept_register_items(concepts):
+    """Fill in the register rows of a page of (uri, label) pairs returned by list_concepts()."""
+    items = []
+    for c, label in concepts:
         date_created = get_created_date(c)
         date_modified = get_modified_date(c)
         definition = get_definition(c)
         scheme = get_in_scheme(c)
-        concepts.append((c, label, [
+        items.append((c, label, [
             (URIRef('http://purl.org/dc/terms/created'), date_created),
             (URIRef('http://purl.org/dc/terms/modified'), date_modified),
             (URIRef('http://www.w3.org/2004/02/skos/core#definition'), definition),
             (URIRef('http://www.w3.org/2004/02/skos/core#inScheme'), scheme)
         ]))
-    return sorted(concepts, key=lambda i: i[1])
+    return items
 
 
 def list_concept_schemes():
@@ -59,33 +102,31 @@ def list_concept_schemes():
 
 
 def list_concept_schemes_and_collections():
-    items = []
+    """
+    All concept schemes and collections that are not deprecated as (uri, label) pairs sorted by label, see
+    vocabulary_register_items().
+    """
+    return _index().vocabularies
 
-    for cc in Config.g.subjects(RDF.type, SKOS.ConceptScheme):
-        if not is_deprecated(cc):
-            label = get_label(cc)
-            date_created = get_created_date(cc)
-            date_modified = get_modified_date(cc)
-            description = get_description(cc)
-            items.append((cc, label, [
-                (URIRef('http://purl.org/dc/terms/created'), date_created),
-                (URIRef('http://purl.org/dc/terms/modified'), date_modified),
-                description
-            ]))
-
-    for cc in Config.g.subjects(RDF.type, SKOS.Collection):
-        if not is_deprecated(cc):
-            label = get_label(cc)
-            date_created = get_created_date(cc)
-            date_modified = get_modified_date(cc)
-            description = get_description(cc)
-            items.append((cc, label, [
-                (URIRef('http://purl.org/dc/terms/created'), date_created),
-                (URIRef('http://purl.org/dc/terms/modified'), date_modified),
-                description
-            ]))
-
-    return sorted(items, key=lambda i: i[1])
+
+def search_concept_schemes_and_collections(query):
+    """Concept schemes and collections matching the search query as (uri, label) pairs, best match first."""
+    return graph_management.current_version().vocabulary_search.search(query)
+
+
+def vocabulary_register_items(vocabularies):
+    """Fill in the register rows of a page of (uri, label) pairs returned by list_concept_schemes_and_collections()."""
+    items = []
+    for cc, label in vocabularies:
+        date_created = get_created_date(cc)
+        date_modified = get_modified_date(cc)
+        description = get_description(cc)
+        items.append((cc, label, [
+            (URIRef('http://purl.org/dc/terms/created'), date_created),
+            (URIRef('http://purl.org/dc/terms/modified'), date_modified),
+            description
+        ]))
+    return items
 
 
 def _split_camel_case_label(label):
@@ -104,39 +145,84 @@ def _split_camel_case_label(label):
 def get_label(uri, create=True):
     # TODO: title() capitalises all words, we need a post-process function to lower case words that are of types
     #       such as preposition and conjunction.
-    for label in Config.g.objects(URIRef(uri), SKOS.prefLabel):
-        return label
-    for label in Config.g.objects(URIRef(uri), DCTERMS.title):
-        return label
-    for label in Config.g.objects(URIRef(uri), RDFS.label):
+    label = _index().label(uri)
+    if label is not None:
         return label
 
     # Fetch label by dereferencing URI.
     if create:
-        headers = {'accept': 'text/turtle'}
-        response_g = Graph()
-        try:
-            r = requests.get(uri, headers=headers)
-            assert 200 <= r.status_code < 300
-            response_g.parse(data=r.content.decode('utf-8'), format='turtle')
-            for _, _, label in response_g.triples((uri, SKOS.prefLabel, None)):
-                return label
-            for _, _, label in response_g.triples((uri, RDFS.label, None)):
-                return label
-        except Exception as e:
-            # print(uri)
-            # print('Error dereferencing external URI:', str(e))
-            # print(r.content.decode('utf-8'))
-            # print('Create label from the local name of the URI instead.')
-
+        hit, label = label_cache.cache.get(uri)
+        metrics.LABEL_CACHE_REQUESTS.inc(result='hit' if hit else 'miss')
+        if not hit:
+            start_time = time.time()
+            label = _dereference_label(uri)
+            metrics.LABEL_DEREFERENCE_SECONDS.observe(time.time() - start_time,
+                                                      outcome='missing' if label is None else 'found')
+            label_cache.cache.put(uri, label)
+        if label is None:
             # Create label out of the local segment of the URI.
             label = helper.uri_label(uri)
             label = _split_camel_case_label(label)
             return Literal(label)
+        return label
     else:
         return Literal(str(uri).split('#')[-1].split('/')[-1])
 
 
+# Responses larger than this are not labels of a single resource.
+_MAX_DEREFERENCE_BYTES = 1024 * 1024
+
+
+def _dereference_label(uri):
+    """Fetch the label of a URI from its Turtle representation. Returns None if there is no label to be had."""
+    # Imported on first use, as most labels come from the graph or the label cache.
+    import requests
+
+    headers = {'accept': 'text/turtle'}
+    deadline = time.time() + Config.label_fetch_timeout
+    try:
+        # Connecting and each read of the status line and headers may take the time left until the deadline.
+        remaining = deadline - time.time()
+        with requests.get(uri, headers=headers, timeout=(remaining, remaining), stream=True) as r:
+            if not 200 <= r.status_code < 300:
+                return None
+            # Each read of the body may take the time left until the deadline. A read can wait on the socket more than
+            # once, so a server that trickles bytes could still hold this thread past the deadline. A timer closes the
+            # connection when the deadline passes, which ends a blocked read.
+            watchdog = threading.Timer(max(0.0, deadline - time.time()), r.close)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                sock = getattr(getattr(r.raw, 'connection', None), 'sock', None)
+                content = b''
+                while True:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    if sock is not None:
+                        sock.settimeout(remaining)
+                    chunk = r.raw.read(8 * 1024, decode_content=True)
+                    if not chunk:
+                        break
+                    content += chunk
+                    if len(content) > _MAX_DEREFERENCE_BYTES:
+                        return None
+            finally:
+                watchdog.cancel()
+            if time.time() > deadline:
+                return None
+        response_g = Graph()
+        response_g.parse(data=content.decode('utf-8'), format='turtle')
+    except Exception:
+        return None
+
+    for label in response_g.objects(URIRef(uri), SKOS.prefLabel):
+        return label
+    for label in response_g.objects(URIRef(uri), RDFS.label):
+        return label
+    return None
+
+
 def get_description(uri):
     for description in Config.g.objects(URIRef(uri), DCTERMS.description):
         return (DCTERMS.description, description)
@@ -153,7 +239,7 @@ def get_definition(uri):
 
 def get_class_types(uri):
     types = []
-    for type in Config.g.objects(URIRef(uri), RDF.type):
+    for type in _index().types.get(URIRef(uri), ()):
         # Only add URIs (and not blank nodes!)
         if str(type)[:4] == 'http' \
                 and str(type) != 'http://www.w3.org/2004/02/skos/core#ConceptScheme' \
@@ -164,14 +250,12 @@ def get_class_types(uri):
 
 
 def is_deprecated(uri):
-    for value in Config.g.objects(URIRef(uri), OWL.deprecated):
-        return bool(value)
-    return False
+    return _index().is_deprecated(uri)
 
 
 def get_narrowers(uri):
     narrowers = []
-    for narrower in Config.g.objects(URIRef(uri), SKOS.narrower):
+    for narrower in _index().narrowers.get(URIRef(uri), ()):
         if not is_deprecated(narrower):
             label = get_label(narrower)
             narrowers.append((narrower, label))
@@ -180,7 +264,7 @@ def get_narrowers(uri):
 
 def get_broaders(uri):
     broaders = []
-    for broader in Config.g.objects(URIRef(uri), SKOS.broader):
+    for broader in _index().broaders.get(URIRef(uri), ()):
         if not is_deprecated(broader):
             label = get_label(broader)
             broaders.append((broader, label))
@@ -189,7 +273,7 @@ def get_broaders(uri):
 
 def get_members(uri):
     members = []
-    for member in Config.g.objects(URIRef(uri), SKOS.member):
+    for member in _index().members.get(URIRef(uri), ()):
         label = get_label(member)
         members.append((member, label))
     return sorted(members, key=lambda i: i[1])
@@ -197,7 +281,7 @@ def get_members(uri):
 
 def get_top_concept_of(uri):
     top_concept_ofs = []
-    for tco in Config.g.objects(URIRef(uri), SKOS.topConceptOf):
+    for tco in _index().top_concept_of.get(URIRef(uri), ()):
         label = get_label(tco)
         top_concept_ofs.append((tco, label))
     return sorted(top_concept_ofs, key=lambda i: i[1])
@@ -205,7 +289,7 @@ def get_top_concept_of(uri):
 
 def get_top_concepts(uri):
     top_concepts = []
-    for tc in Config.g.objects(URIRef(uri), SKOS.hasTopConcept):
+    for tc in _index().top_concepts.get(URIRef(uri), ()):
         label = get_label(tc)
         top_concepts.append((tc, label))
     return sorted(top_concepts, key=lambda i: i[1])
@@ -239,13 +323,14 @@ def get_modified_date(uri):
 
 def get_uri_skos_type(uri):
     uri = parse.unquote_plus(uri)
-    for _ in Config.g.triples((URIRef(uri), RDF.type, URIRef('https://w3id.org/tern/ontologies/tern/Method'))):
+    types = _index().types.get(URIRef(uri), ())
+    if METHOD_CLASS in types:
         return METHOD
-    for _ in Config.g.triples((URIRef(uri), RDF.type, SKOS.ConceptScheme)):
+    if SKOS.ConceptScheme in types:
         return CONCEPTSCHEME
-    for _ in Config.g.triples((URIRef(uri), RDF.type, SKOS.Concept)):
+    if SKOS.Concept in types:
         return CONCEPT
-    for _ in Config.g.triples((URIRef(uri), RDF.type, SKOS.Collection)):
+    if SKOS.Collection in types:
         return COLLECTION
     return None
 
@@ -279,71 +364,217 @@ def get_properties(uri):
     return properties
 
 
+def get_scheme_members(uri):
+    """The concepts of a concept scheme, see SkosIndex.scheme_members."""
+    return _index().scheme_members.get(URIRef(uri), ())
+
+
 def get_in_scheme(uri):
     """A concept scheme in which the concept is a part of. A concept may be a member of more than one concept scheme"""
     schemes = []
-    for scheme in Config.g.objects(URIRef(uri), SKOS.inScheme):
+    for scheme in _index().in_scheme.get(URIRef(uri), ()):
         label = get_label(scheme)
         schemes.append((scheme, label))
     return schemes
 
 
-def _add_narrower(uri, hierarchy, indent):
-    concepts = []
+def _sorted_items(uris):
+    items = [(uri, get_label(uri)) for uri in uris if not is_deprecated(uri)]
+    items.sort(key=lambda i: i[1])
+    return items
 
-    for concept in Config.g.objects(URIRef(uri), SKOS.narrower):
-        if not is_deprecated(concept):
-            label = get_label(concept)
-            concepts.append((concept, label))
 
-    for concept in Config.g.objects(URIRef(uri), SKOS.member):
-        if not is_deprecated(concept):
-            label = get_label(concept)
-            concepts.append((concept, label))
+def _narrower_items(uri):
+    index = _index()
+    uri = URIRef(uri)
+    return _sorted_items(list(index.narrowers.get(uri, ())) + list(index.members.get(uri, ())))
 
-    concepts.sort(key=lambda i: i[1])
 
-    for concept in concepts:
-        tab = indent * '\t'
-        hierarchy += tab + '- [{}]({})\n'.format(concept[1], url_for('routes.ob', uri=concept[0]))
-        hierarchy = _add_narrower(concept[0], hierarchy, indent + 1)
+def _tree_link(uri, label):
+    return '<a href="{}">{}</a>'.format(escape(url_for('routes.ob', uri=uri)), escape(str(label), quote=False))
 
-    return hierarchy
 
+def _render_concept_tree(uri, items):
+    """
+    Render the tree below the given (uri, label) items as nested HTML lists in a single pass.
 
-def get_concept_hierarchy_collection(uri):
-    hierarchy = ''
-    members = []
+    Every item with narrower concepts or members gets a caret and its children are in a nested list directly after it,
+    as expected by the scripts in templates/macros/concept_hierarchy.html.
 
-    for concept_or_collection in Config.g.objects(URIRef(uri), SKOS.member):
-        if not is_deprecated(concept_or_collection):
-            label = get_label(concept_or_collection)
-            members.append((concept_or_collection, label))
+    The tree is walked iteratively. A child that is already one of its own ancestors is left out and the cycle is
+    logged. Items deeper than Config.hierarchy_max_depth are shown without their children and the tree stops after
+    Config.hierarchy_max_nodes items.
+    """
+    parts = ['<div id="concept-hierarchy">']
+    if items:
+        parts.append('<ul>\n')
+
+        # One iterator over the remaining siblings per open level, and the items whose children are being listed.
+        stack = [iter(items)]
+        path = []
+        on_path = set()
+        nodes = 0
+        cycles = []
+        depth_limited = False
+        node_limited = False
+
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                if path:
+                    on_path.discard(path.pop())
+                    parts.append('</ul>\n</li>\n')
+                continue
+
+            if nodes >= Config.hierarchy_max_nodes:
+                node_limited = True
+                break
+            nodes += 1
+
+            item_uri, label = item
+            children = []
+            if len(path) + 1 < Config.hierarchy_max_depth:
+                for child in _narrower_items(item_uri):
+                    if child[0] == item_uri or child[0] in on_path:
+                        cycle = path[path.index(child[0]):] if child[0] in on_path else []
+                        cycles.append(cycle + [item_uri, child[0]])
+                    else:
+                        children.append(child)
+            elif _narrower_items(item_uri):
+                depth_limited = True
+
+            link = _tree_link(item_uri, label)
+            if children:
+                parts.append('<li><span class="caret">{}</span><ul class="nested">\n'.format(link))
+                stack.append(iter(children))
+                path.append(item_uri)
+                on_path.add(item_uri)
+            else:
+                parts.append('<li>{}</li>\n'.format(link))
+
+        if node_limited:
+            parts.append('</ul>\n</li>\n' * len(path))
+            parts.append('<li><em>Only the first {} concepts are shown.</em></li>\n'.format(nodes))
+            logger.warning(f'Hierarchy of {uri} truncated after {nodes} concepts.')
+        if depth_limited:
+            logger.warning(f'Hierarchy of {uri} truncated at a depth of {Config.hierarchy_max_depth}.')
+        for cycle in cycles:
+            logger.warning(f'Cycle in the hierarchy of {uri}: {" -> ".join(cycle)}')
+
+        parts.append('</ul>')
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+def _hierarchy_child_uris(uri):
+    index = _index()
+    uri = URIRef(uri)
+    uris = chain(index.top_concepts.get(uri, ()), index.narrowers.get(uri, ()), index.members.get(uri, ()))
+    uris = dict.fromkeys(uris)
+    return [child for child in uris if not index.is_deprecated(child)]
 
-    members.sort(key=lambda i: i[1])
 
-    for member in members:
-        hierarchy += '- [{}]({})\n'.format(member[1], url_for('routes.ob', uri=member[0]))
-        hierarchy = _add_narrower(member[0], hierarchy, 1)
+_HIERARCHY_NODE_TYPES = (SKOS.ConceptScheme, SKOS.Collection, SKOS.Concept)
 
-    return '<div id="concept-hierarchy">' + markdown.markdown(hierarchy) + '</div>'
 
+def is_hierarchy_node(uri):
+    """Whether the URI is a concept scheme, collection or concept, the only nodes a concept hierarchy has."""
+    types = _index().types.get(URIRef(uri), ())
+    return any(class_type in types for class_type in _HIERARCHY_NODE_TYPES)
 
-def get_concept_hierarchy(uri):
-    hierarchy = ''
-    top_concepts = []
 
-    for top_concept in Config.g.objects(URIRef(uri), SKOS.hasTopConcept):
-        if not is_deprecated(top_concept):
-            label = get_label(top_concept)
-            top_concepts.append((top_concept, label))
+def get_hierarchy_children(uri):
+    """
+    The top concepts, narrower concepts and members of a node in the concept hierarchy as (uri, label) pairs sorted by
+    label, or None if the URI is not a node of a concept hierarchy. Cached per graph version, which only ever holds the
+    nodes of the graph.
+    """
+    children = graph_management.current_version().hierarchy_children
+    items = children.get(str(uri))
+    if items is None:
+        if not is_hierarchy_node(uri):
+            return None
+        items = tuple(_sorted_items(_hierarchy_child_uris(uri)))
+        children[str(uri)] = items
+    return items
+
+
+def count_hierarchy_children(uri):
+    return len(_hierarchy_child_uris(uri))
+
+
+def _hierarchy_exceeds(roots, limit):
+    """Whether more than limit distinct items are reachable from the roots. Stops as soon as the limit is passed."""
+    visited = set()
+    stack = list(roots)
+    while stack:
+        uri = stack.pop()
+        if uri in visited:
+            continue
+        visited.add(uri)
+        if len(visited) > limit:
+            return True
+        stack.extend(_hierarchy_child_uris(uri))
+    return False
+
+
+def _lazy_tree_item(uri, label):
+    link = _tree_link(uri, label)
+    if count_hierarchy_children(uri):
+        return '<li><span class="caret">{}</span><ul class="nested" data-children="{}"></ul></li>\n'.format(
+            link, escape(url_for('routes.hierarchy_children', uri=uri)))
+    return '<li>{}</li>\n'.format(link)
+
+
+def _render_lazy_concept_tree(uri):
+    """
+    Render the first page of the top level of the hierarchy only. Deeper levels and further pages are loaded by
+    templates/macros/concept_hierarchy.html from the routes.hierarchy_children endpoint when they are expanded.
+    """
+    items = get_hierarchy_children(uri) or ()
+    parts = ['<div id="concept-hierarchy">']
+    if items:
+        parts.append('<ul>\n')
+        for item_uri, label in items[:Config.hierarchy_page_size]:
+            parts.append(_lazy_tree_item(item_uri, label))
+        if len(items) > Config.hierarchy_page_size:
+            parts.append('<li class="tree-more"><a href="#" data-children="{}">Show more</a></li>\n'.format(
+                escape(url_for('routes.hierarchy_children', uri=uri, page=2))))
+        parts.append('</ul>')
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+def _cached_concept_tree(uri, roots):
+    # The whole tree, or only its top level with the rest loaded on demand. Chosen by the size of the tree unless the
+    # hierarchy query parameter asks for one of them.
+    mode = request.args.get('hierarchy')
+    if mode not in ('full', 'lazy'):
+        mode = None
+
+    # The links depend on the script root the application is mounted at.
+    key = (str(uri), request.script_root, mode)
+    trees = graph_management.current_version().concept_trees
+    tree = trees.get(key)
+    if tree is None:
+        root_uris = roots(URIRef(uri))
+        if mode is None:
+            mode = 'lazy' if _hierarchy_exceeds(root_uris, Config.hierarchy_lazy_threshold) else 'full'
+        if mode == 'lazy':
+            tree = _render_lazy_concept_tree(uri)
+        else:
+            tree = _render_concept_tree(uri, _sorted_items(root_uris))
+        trees[key] = tree
+    return tree
+
+
+def get_concept_hierarchy_collection(uri):
+    return _cached_concept_tree(uri, lambda uri: _index().members.get(uri, ()))
 
-    top_concepts.sort(key=lambda i: i[1])
 
-    for top_concept in top_concepts:
-        hierarchy += '- [{}]({})\n'.format(top_concept[1], url_for('routes.ob', uri=top_concept[0]))
-        hierarchy = _add_narrower(top_concept[0], hierarchy, 1)
-    return '<div id="concept-hierarchy">' + markdown.markdown(hierarchy) + '</div>'
+def get_concept_hierarchy(uri):
+    return _cached_concept_tree(uri, lambda uri: _index().top_concepts.get(uri, ()))
 
 
 def get_is_defined_by(uri):
@@ -434,7 +665,7 @@ def member_of(uri):
     The inverse of skos:member - used for better UI navigation.
     """
     collections = []
-    for collection in Config.g.subjects(SKOS.member, URIRef(uri)):
+    for collection in _index().member_of.get(URIRef(uri), ()):
         label = get_label(collection)
         collections.append((collection, label))
     return collections
@@ -455,19 +686,18 @@ def get_rdf_object(uri):
         return o
 
 
-def get_mapping_statement(uri):
-    uri = URIRef(uri)
-    for statement in Config.g.subjects(RDF.type, RDF.Statement):
-        for _, p, o in Config.g.triples((statement, None, None)):
-            if p == RDF.subject and o == uri:
-                return [
-                    statement,
-                    get_rdf_predicate(statement),
-                    get_rdf_object(statement),
-                    get_created_date(statement),
-                    get_creator(statement),
-                    get_description(statement)[1],
-                ]
+def get_mapping_statements(uri):
+    statements = []
+    for statement in _index().statements.get(URIRef(uri), ()):
+        statements.append([
+            statement,
+            get_rdf_predicate(statement),
+            get_rdf_object(statement),
+            get_created_date(statement),
+            get_creator(statement),
+            get_description(statement)[1],
+        ])
+    return statements
 
 
 def get_method_purpose(uri):
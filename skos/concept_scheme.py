@@ -1,13 +1,18 @@
+import os
+
 from pyldapi.renderer import Renderer
 from pyldapi.view import View
-from flask import render_template, Response
+from flask import render_template, request, send_file
 from rdflib import URIRef, Graph
-from rdflib.namespace import SKOS
 
 
 import skos
 from skos.common_properties import CommonPropertiesMixin
 from config import Config
+import downloads
+import graph_management
+import http_cache
+import snapshot
 
 
 class ConceptScheme(CommonPropertiesMixin):
@@ -33,34 +38,29 @@ class ConceptSchemeRenderer(Renderer):
 
         super().__init__(request, uri, views, 'skos')
 
-    def _add_concept_by_narrower(self, g, concept):
-        for narrower_concept in g.objects(concept, SKOS.narrower):
-            for subj, pred, obj in Config.g.triples((narrower_concept, None, None)):
-                g.add((subj, pred, obj))
-                self._add_concept_by_narrower(g, narrower_concept)
-
     def _render_skos_rdf(self):
-        # TODO: Add this inference algorithm to start-up so that each concept within a concept scheme is tagged with
-        #       the property skos:InScheme. This will reduce the RDF load-time for concept schemes that have lots of
-        #       narrower concepts.
-        #       .
-        #       This method should then be replaced with just getting the concept scheme and concept by skos:inScheme.
-        g = Graph()
+        # Written once per graph version and format, then served as a static file by every worker.
+        path = downloads.scheme_export_path(graph_management.current_version().id, self.uri, self.format)
+        if not os.path.isfile(path):
+            g = Graph()
 
-        # Get the concept scheme properties
-        for subj, pred, obj in Config.g.triples((URIRef(self.uri), None, None)):
-            g.add((subj, pred, obj))
-
-        # Get the concepts by skos;inScheme
-        for concept in Config.g.subjects(SKOS.inScheme, URIRef(self.uri)):
-            for subj, pred, obj in Config.g.triples((concept, None, None)):
+            # Get the concept scheme properties
+            for subj, pred, obj in Config.g.triples((URIRef(self.uri), None, None)):
                 g.add((subj, pred, obj))
 
-        # Get the concepts by skos:topConceptOf
-        for concept in Config.g.subjects(SKOS.topConceptOf, URIRef(self.uri)):
-            self._add_concept_by_narrower(g, concept)
+            # Get the concepts of the concept scheme
+            for concept in skos.get_scheme_members(self.uri):
+                for subj, pred, obj in Config.g.triples((concept, None, None)):
+                    g.add((subj, pred, obj))
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            snapshot.write_atomic(path, g.serialize(format=self.format))
 
-        return Response(g.serialize(format=self.format), mimetype=self.format)
+        # With the validators of every other response (see http_cache.py) rather than send_file's own, so that If-Range
+        # and If-None-Match are checked against the same ETag.
+        response = send_file(os.path.abspath(path), mimetype=self.format, conditional=False, add_etags=False)
+        http_cache.add_validators(response, graph_management.current_version())
+        return response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
 
     def render(self):
         if not hasattr(self, 'format'):
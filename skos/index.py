@@ -0,0 +1,112 @@
+from rdflib import Graph, URIRef, Literal
+from rdflib.namespace import RDF, SKOS, DCTERMS, RDFS, OWL
+
+
+# In order of preference, see skos.get_label().
+LABEL_PREDICATES = (SKOS.prefLabel, DCTERMS.title, RDFS.label)
+
+
+def _adjacency(g: Graph, predicate, inverse=False):
+    adjacency = {}
+    for s, o in g.subject_objects(predicate):
+        if inverse:
+            s, o = o, s
+        adjacency.setdefault(s, []).append(o)
+    return adjacency
+
+
+class SkosIndex:
+    """
+    Lookup tables for the SKOS properties the viewer reads most, built once per graph version.
+
+    Every getter in the skos module that would otherwise issue a triple-pattern lookup per call (often once per child
+    inside a loop) answers from these dicts instead.
+    """
+    def __init__(self, g: Graph):
+        self.labels = {}
+        for predicate in LABEL_PREDICATES:
+            for s, label in g.subject_objects(predicate):
+                self.labels.setdefault(s, label)
+
+        self.types = {}
+        for s, t in g.subject_objects(RDF.type):
+            self.types.setdefault(s, set()).add(t)
+
+        deprecated = {}
+        for s, value in g.subject_objects(OWL.deprecated):
+            deprecated.setdefault(s, bool(value))
+        self.deprecated = {s for s, value in deprecated.items() if value}
+
+        self.narrowers = _adjacency(g, SKOS.narrower)
+        self.broaders = _adjacency(g, SKOS.broader)
+        self.members = _adjacency(g, SKOS.member)
+        self.member_of = _adjacency(g, SKOS.member, inverse=True)
+        self.in_scheme = _adjacency(g, SKOS.inScheme)
+        self.top_concept_of = _adjacency(g, SKOS.topConceptOf)
+        self.top_concepts = _adjacency(g, SKOS.hasTopConcept)
+        self.scheme_members = self._scheme_members()
+
+        # Reified statements (such as mappings to an upper vocabulary) by their rdf:subject.
+        self.statements = {}
+        for statement, subject in g.subject_objects(RDF.subject):
+            if RDF.Statement in self.types.get(statement, ()):
+                self.statements.setdefault(subject, []).append(statement)
+        for statements in self.statements.values():
+            statements.sort()
+
+        # Register listings as (uri, label) pairs sorted by label. Only the rows of the requested page are filled in
+        # with dates and descriptions, see skos.concept_register_items().
+        self.concepts = self._listing(g.subjects(RDF.type, SKOS.Concept))
+        self.vocabularies = self._listing(
+            uri for class_type in (SKOS.ConceptScheme, SKOS.Collection) for uri in g.subjects(RDF.type, class_type)
+            if uri not in self.deprecated
+        )
+
+    def _scheme_members(self):
+        """
+        The concepts of each concept scheme: the concepts in the scheme, its top concepts and every concept narrower
+        than one of its top concepts.
+        """
+        members = {}
+        for concept, schemes in self.in_scheme.items():
+            for scheme in schemes:
+                members.setdefault(scheme, {})[concept] = None
+
+        for top_concept, schemes in self.top_concept_of.items():
+            for scheme in schemes:
+                scheme_members = members.setdefault(scheme, {})
+                scheme_members[top_concept] = None
+                visited = {top_concept}
+                stack = [top_concept]
+                while stack:
+                    for narrower in self.narrowers.get(stack.pop(), ()):
+                        if narrower not in visited:
+                            visited.add(narrower)
+                            scheme_members[narrower] = None
+                            stack.append(narrower)
+
+        return {scheme: tuple(concepts) for scheme, concepts in members.items()}
+
+    def _listing(self, uris):
+        # Unlabelled resources fall back to the local name of the URI, like skos.get_label(create=False). Labels are
+        # never dereferenced while building an index.
+        items = []
+        for uri in uris:
+            label = self.labels.get(uri)
+            if label is None:
+                label = Literal(str(uri).split('#')[-1].split('/')[-1])
+            items.append((uri, label))
+        if all(isinstance(label, Literal) and label.datatype is None for _, label in items):
+            # Plain and language-tagged literals order by their lexical form. Comparing the strings directly is much
+            # faster than Literal's rich comparison.
+            return tuple(sorted(items, key=lambda i: str(i[1])))
+        return tuple(sorted(items, key=lambda i: i[1]))
+
+    def label(self, uri):
+        return self.labels.get(URIRef(uri))
+
+    def has_type(self, uri, class_type):
+        return class_type in self.types.get(URIRef(uri), ())
+
+    def is_deprecated(self, uri):
+        return URIRef(uri) in self.deprecated
@@ -1,10 +1,44 @@
+import json
+
 from flask import render_template
-from rdflib import Graph, Namespace, Literal, URIRef
-from rdflib.namespace import RDF, DCTERMS, XSD, RDFS, FOAF
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import DCTERMS, XSD, RDFS, FOAF
 
 from pyldapi.register_renderer import RegisterRenderer
 
 from config import Config
+import graph_management
+
+# Registers of these classes describe their items as the datasets of a DCAT catalog.
+VOCABULARY_CLASSES = {
+    'http://www.w3.org/2004/02/skos/core#ConceptScheme',
+    'http://www.w3.org/2004/02/skos/core#Collection',
+}
+
+DISTRIBUTION_MEDIA_TYPES = ('text/html', 'text/turtle', 'application/rdf+xml', 'application/ld+json', 'text/n3',
+                            'application/n-triples')
+
+JSON_LD_CONTEXT = {
+    'dcat': 'http://www.w3.org/ns/dcat#',
+    'dcterms': str(DCTERMS),
+    'foaf': str(FOAF),
+    'rdfs': str(RDFS),
+}
+
+
+def _json_ld_value(term):
+    if isinstance(term, Literal):
+        value = {'@value': str(term)}
+        if term.language:
+            value['@language'] = term.language
+        elif term.datatype:
+            value['@type'] = str(term.datatype)
+        return value
+    if isinstance(term, URIRef):
+        return {'@id': str(term)}
+    if isinstance(term, BNode):
+        return {'@id': '_:{}'.format(term)}
+    return str(term)
 
 
 class Register(RegisterRenderer):
@@ -19,92 +53,86 @@ class Register(RegisterRenderer):
         self.search_query = search_query
 
         super().__init__(request, request.base_url, label, comment, items, contained_item_classes, total_items_count,
-                         register_template=register_template)
+                         register_template=register_template, per_page=Config.register_page_size,
+                         page_size_max=Config.register_page_size_max)
 
-    def _generate_dcat_html_metadata(self):
-        if 'http://www.w3.org/2004/02/skos/core#ConceptScheme' or 'http://www.w3.org/2004/02/skos/core#Collection' in \
-                self.contained_item_classes:
-            # If this register is rendering the view for skos:ConceptSchemes or skos:Collections,
-            # then inject additional HTML.
-
-            g = Graph()
-            DCAT = Namespace('http://www.w3.org/ns/dcat#')
-
-            # Catalog
-            catalog = URIRef(self.request.base_url)
-            g.add((catalog, RDF.type, DCAT.Catalog))
-            g.add((catalog, DCTERMS.title, Literal(Config.title)))
-            g.add((catalog, RDFS.label, Literal(Config.title)))
-            g.add((catalog, DCTERMS.description, Literal(Config.description)))
-            # g.add((catalog, FOAF.landingPage, catalog))
-            g.add((catalog, FOAF.homepage, URIRef(self.request.url_root)))
-
-            for item in self.register_items:
-                # Dataset
-                g.add((item[0], RDF.type, DCAT.Dataset))
-                g.add((item[0], DCTERMS.title, item[1]))
-                g.add((item[0], RDFS.label, item[1]))
-                g.add((item[0], DCTERMS.type, URIRef('http://id.loc.gov/vocabulary/marcgt/dic')))
-                g.add((item[0], DCAT.landingPage, URIRef('{}id/{}'.format(self.request.host_url, item[0]))))
-                g.add((catalog, DCAT.dataset, item[0]))
-
-                if item[2][0][1]:
-                    # dcterms:created
-                    g.add((item[0], item[2][0][0], Literal(item[2][0][1], datatype=XSD.date)))
-                if item[2][1][1]:
-                    # dcterms:modified
-                    g.add((item[0], item[2][1][0], Literal(item[2][1][1], datatype=XSD.date)))
-                if item[2][2] and item[2][2][1]:
-                    # dcterms:description
-                    g.add((item[0], item[2][2][0], item[2][2][1]))
-
-                # Distribution
-                subject = URIRef(self.request.host_url + '?_format=text/html&_view=skos')
-                g.add((subject, RDF.type, DCAT.Distribution))
-                g.add((subject, DCAT.downloadURL, subject))
-                g.add((subject, DCAT.mediaType, URIRef('https://www.iana.org/assignments/media-types/text/html')))
-                g.add((catalog, DCAT.distribution, subject))
-
-                subject = URIRef(self.request.host_url + '?_format=text/turtle&_view=skos')
-                g.add((subject, RDF.type, DCAT.Distribution))
-                g.add((subject, DCAT.downloadURL, subject))
-                g.add((subject, DCAT.mediaType, URIRef('https://www.iana.org/assignments/media-types/text/turtle')))
-                g.add((catalog, DCAT.distribution, subject))
-
-                subject = URIRef(self.request.host_url + '?_format=application/rdf+xml&_view=skos')
-                g.add((subject, RDF.type, DCAT.Distribution))
-                g.add((subject, DCAT.downloadURL, subject))
-                g.add((subject, DCAT.mediaType,
-                       URIRef('https://www.iana.org/assignments/media-types/application/rdf+xml')))
-                g.add((catalog, DCAT.distribution, subject))
-
-                subject = URIRef(self.request.host_url + '?_format=application/ld+json&_view=skos')
-                g.add((subject, RDF.type, DCAT.Distribution))
-                g.add((subject, DCAT.downloadURL, subject))
-                g.add((subject, DCAT.mediaType,
-                       URIRef('https://www.iana.org/assignments/media-types/application/ld+json')))
-                g.add((catalog, DCAT.distribution, subject))
-
-                subject = URIRef(self.request.host_url + '?_format=text/n3&_view=skos')
-                g.add((subject, RDF.type, DCAT.Distribution))
-                g.add((subject, DCAT.downloadURL, subject))
-                g.add((subject, DCAT.mediaType,
-                       URIRef('https://www.iana.org/assignments/media-types/text/n3')))
-                g.add((catalog, DCAT.distribution, subject))
-
-                subject = URIRef(self.request.host_url + '?_format=application/n-triples&_view=skos')
-                g.add((subject, RDF.type, DCAT.Distribution))
-                g.add((subject, DCAT.downloadURL, subject))
-                g.add((subject, DCAT.mediaType,
-                       URIRef('https://www.iana.org/assignments/media-types/application/n-triples')))
-                g.add((catalog, DCAT.distribution, subject))
-
-            additional_html = '<script type="application/ld+json">' + g.serialize(format='json-ld').decode('utf-8') + '</script>'
-        else:
-            additional_html = None
+    def _paging(self):
+        # Keep the requested page and page size within bounds instead of failing on them.
+        self.per_page = min(max(self.per_page, 1), self.page_size_max)
+        # Same last page as RegisterRenderer._paging().
+        self.page = min(max(self.page, 1), int(round(self.register_total_count / self.per_page, 0)) + 1)
+        return super()._paging()
 
+    def page_items(self, items):
+        """The slice of a sorted listing shown on the requested page."""
+        start = (self.page - 1) * self.per_page
+        return items[start:start + self.per_page]
+
+    def _generate_dcat_html_metadata(self):
+        """The vocabulary register as a JSON-LD DCAT catalog, built once per graph version and page."""
+        if not VOCABULARY_CLASSES.intersection(self.contained_item_classes):
+            return None
+        if self.search_query:
+            # Search results are not cached, there is no end to the queries.
+            return self._dcat_html_metadata()
+
+        # Only the register, the page and the page size, which are bounded, vary the data. Its IRIs are host-relative,
+        # as the host comes from the request's Host header.
+        key = (self.request.script_root + self.request.path, self.page, self.per_page)
+        cache = graph_management.current_version().dcat_metadata
+        additional_html = cache.get(key)
+        if additional_html is None:
+            additional_html = cache[key] = self._dcat_html_metadata()
         return additional_html
 
+    def _dcat_html_metadata(self):
+        catalog = {
+            '@id': self.request.script_root + self.request.path,
+            '@type': 'dcat:Catalog',
+            'dcterms:title': Config.title,
+            'rdfs:label': Config.title,
+            'dcterms:description': Config.description,
+            'foaf:homepage': {'@id': self.request.script_root + '/'},
+        }
+        nodes = [catalog]
+
+        for uri, label, properties in self.register_items:
+            dataset = {
+                '@id': str(uri),
+                '@type': 'dcat:Dataset',
+                'dcterms:title': _json_ld_value(label),
+                'rdfs:label': _json_ld_value(label),
+                'dcterms:type': {'@id': 'http://id.loc.gov/vocabulary/marcgt/dic'},
+                'dcat:landingPage': {'@id': '/id/{}'.format(uri)},
+            }
+            # dcterms:created and dcterms:modified
+            for predicate, value in properties[:2]:
+                if value:
+                    dataset[str(predicate)] = {'@value': value.isoformat(), '@type': str(XSD.date)}
+            # dcterms:description
+            if properties[2] and properties[2][1]:
+                dataset[str(properties[2][0])] = _json_ld_value(properties[2][1])
+            nodes.append(dataset)
+        catalog['dcat:dataset'] = [{'@id': node['@id']} for node in nodes[1:]]
+
+        if self.register_items:
+            # The same distributions of the whole vocabulary serve every dataset.
+            distributions = []
+            for media_type in DISTRIBUTION_MEDIA_TYPES:
+                subject = '/?_format={}&_view=skos'.format(media_type)
+                distributions.append({
+                    '@id': subject,
+                    '@type': 'dcat:Distribution',
+                    'dcat:downloadURL': {'@id': subject},
+                    'dcat:mediaType': {'@id': 'https://www.iana.org/assignments/media-types/' + media_type},
+                })
+            catalog['dcat:distribution'] = [{'@id': node['@id']} for node in distributions]
+            nodes += distributions
+
+        data = json.dumps({'@context': JSON_LD_CONTEXT, '@graph': nodes})
+        # No literal in the data can close the script element.
+        return '<script type="application/ld+json">' + data.replace('<', '\\u003c') + '</script>'
+
     def render(self):
         if not hasattr(self, 'format'):
             self.format = 'text/html'
@@ -0,0 +1,109 @@
+import re
+from array import array
+from bisect import bisect_left
+
+from rdflib import Graph
+from rdflib.namespace import SKOS, DCTERMS
+
+# Weight of a query token matching a whole token of each field. The label is the one the register lists, see
+# SkosIndex._listing().
+LABEL_WEIGHT = 8
+FIELD_WEIGHTS = (
+    (SKOS.notation, 6),
+    (SKOS.altLabel, 4),
+    (SKOS.definition, 1),
+    (DCTERMS.description, 1),
+)
+# A query token that is only a prefix of a token scores this fraction of the field's weight.
+PREFIX_FACTOR = 0.5
+# Added when the label equals or starts with the whole query.
+EXACT_LABEL_BONUS = 100
+LABEL_PREFIX_BONUS = 50
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _TOKEN.findall(str(text).lower())
+
+
+class SearchIndex:
+    """
+    Inverted index over the labels, alternative labels, notations and definitions of the items of a register listing.
+
+    Built once per graph version. Documents are positions in the listing, so items with the same score keep the
+    listing's label order.
+    """
+    def __init__(self, g: Graph, listing):
+        self.listing = listing
+        self._labels = [str(label).lower() for _, label in listing]
+
+        postings = {}
+
+        def add(token, doc, weight):
+            docs = postings.setdefault(token, {})
+            if docs.get(doc, 0) < weight:
+                docs[doc] = weight
+
+        docs_by_uri = {}
+        for doc, (uri, label) in enumerate(listing):
+            docs_by_uri[uri] = doc
+            for token in tokenize(label):
+                add(token, doc, LABEL_WEIGHT)
+
+        for predicate, weight in FIELD_WEIGHTS:
+            for uri, value in g.subject_objects(predicate):
+                doc = docs_by_uri.get(uri)
+                if doc is None:
+                    continue
+                for token in tokenize(value):
+                    add(token, doc, weight)
+                if predicate == SKOS.notation:
+                    # Also match notations such as 1.2.3 as a whole.
+                    add(str(value).lower(), doc, weight)
+
+        self._tokens = sorted(postings)
+        self._postings = {}
+        for token, docs in postings.items():
+            self._postings[token] = (array('I', docs.keys()), array('B', docs.values()))
+
+    def _match_token(self, query_token):
+        """Scores of the documents with a token equal to or starting with the query token."""
+        scores = {}
+        start = bisect_left(self._tokens, query_token)
+        for token in self._tokens[start:bisect_left(self._tokens, query_token + '\uffff', start)]:
+            factor = 1 if token == query_token else PREFIX_FACTOR
+            docs, weights = self._postings[token]
+            for doc, weight in zip(docs, weights):
+                score = weight * factor
+                if scores.get(doc, 0) < score:
+                    scores[doc] = score
+        return scores
+
+    def search(self, query):
+        """
+        Items of the listing matching every token of the query, best match first.
+
+        :return: A list of (uri, label) pairs.
+        """
+        query_tokens = set(tokenize(query))
+        if not query_tokens:
+            return []
+
+        scores = None
+        for matches in sorted((self._match_token(token) for token in query_tokens), key=len):
+            if scores is None:
+                scores = matches
+            else:
+                scores = {doc: score + matches[doc] for doc, score in scores.items() if doc in matches}
+            if not scores:
+                return []
+
+        query = ' '.join(query.lower().split())
+        for doc in scores:
+            if self._labels[doc] == query:
+                scores[doc] += EXACT_LABEL_BONUS
+            elif self._labels[doc].startswith(query):
+                scores[doc] += LABEL_PREFIX_BONUS
+
+        return [self.listing[doc] for doc in sorted(scores, key=lambda doc: (-scores[doc], doc))]
@@ -0,0 +1,85 @@
+"""
+Binary snapshots of the harvested graph.
+
+A snapshot is a zlib-compressed pickle of the rdflib Graph written next to the Turtle data file. Loading a snapshot
+skips the Turtle parser entirely, which is the dominant cost of starting a web worker.
+
+File layout:
+    MAGIC | format version (2 bytes) | SHA-256 of the Turtle file (32 bytes) | SHA-256 of the payload (32 bytes) | payload
+
+A snapshot is only used when both digests match, so a snapshot that is stale (the Turtle file changed since it was
+written), truncated or corrupted is never loaded.
+"""
+import hashlib
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+from rdflib import Graph
+
+MAGIC = b'VOCVIEW-SNAPSHOT'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('>{}sH32s32s'.format(len(MAGIC)))
+
+
+class InvalidSnapshot(Exception):
+    pass
+
+
+def digest_bytes(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def file_digest(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def write_atomic(path: str, data: bytes):
+    """Write data to a temporary file and move it into place so readers never see a partial file."""
+    # Unique per writer, so that several processes or threads can race to write the same file.
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(g: Graph, path: str, source_digest: bytes):
+    payload = zlib.compress(pickle.dumps(g, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, source_digest, digest_bytes(payload))
+    write_atomic(path, header + payload)
+
+
+def read_snapshot(path: str, source_digest: bytes) -> Graph:
+    if not os.path.isfile(path):
+        raise InvalidSnapshot(f'No snapshot at path {path}')
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < _HEADER.size:
+        raise InvalidSnapshot('Snapshot is truncated')
+    magic, version, snapshot_source_digest, payload_digest = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise InvalidSnapshot('Unknown snapshot format')
+    if snapshot_source_digest != source_digest:
+        raise InvalidSnapshot('Snapshot is stale')
+
+    payload = memoryview(data)[_HEADER.size:]
+    if digest_bytes(payload) != payload_digest:
+        raise InvalidSnapshot('Snapshot checksum mismatch')
+
+    try:
+        g = pickle.loads(zlib.decompress(payload))
+    except Exception as e:
+        # E.g. the snapshot was written by a different rdflib version.
+        raise InvalidSnapshot(f'Snapshot could not be decoded: {e}')
+    if not isinstance(g, Graph):
+        raise InvalidSnapshot('Snapshot does not contain a graph')
+    return g
@@ -0,0 +1,176 @@
+"""
+A read-only rdflib store backed by a SQLite database.
+
+The background task writes the graph once into a database file with a term table and a triple table of term ids,
+indexed in SPO, POS and OSP order. Web workers query it with SQLite's page cache as the only memory held for the
+graph, bounded by Config.sqlite_cache_kib.
+
+Terms are stored with the same encoding as mmap_store. Like a snapshot, the database records the SHA-256 of the Turtle
+file it was written from and is only used when that matches.
+"""
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+
+from rdflib import Graph, URIRef
+from rdflib.store import Store
+
+from mmap_store import encode_term, decode_term
+
+FORMAT_VERSION = 1
+
+# Decoded terms and term ids kept per process.
+_TERM_CACHE_SIZE = 100000
+
+_SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value BLOB NOT NULL);
+CREATE TABLE terms (id INTEGER PRIMARY KEY, term BLOB NOT NULL UNIQUE);
+CREATE TABLE namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL);
+CREATE TABLE triples (s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL, PRIMARY KEY (s, p, o))
+    WITHOUT ROWID;
+'''
+
+# Created once the triples are in, which is much faster than maintaining them during the inserts.
+_INDEXES = '''
+CREATE INDEX triples_pos ON triples (p, o, s);
+CREATE INDEX triples_osp ON triples (o, s, p);
+ANALYZE;
+'''
+
+_SELECT = '''
+SELECT s.term, p.term, o.term FROM triples t
+JOIN terms s ON s.id = t.s JOIN terms p ON p.id = t.p JOIN terms o ON o.id = t.o
+'''
+
+
+class InvalidStoreFile(Exception):
+    pass
+
+
+def write(g: Graph, path: str, source_digest: bytes):
+    """Write the graph to a database at path, replacing it atomically."""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    ids = {}
+    rows = []
+    for triple in g:
+        rows.append(tuple(ids.setdefault(encode_term(term), len(ids)) for term in triple))
+    rows.sort()
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(_SCHEMA)
+        with connection:
+            connection.executemany('INSERT INTO terms (id, term) VALUES (?, ?)',
+                                   ((i, term) for term, i in ids.items()))
+            connection.executemany('INSERT INTO triples (s, p, o) VALUES (?, ?, ?)', rows)
+            connection.executemany('INSERT INTO namespaces (prefix, uri) VALUES (?, ?)',
+                                   ((prefix, str(namespace)) for prefix, namespace in g.namespaces()))
+            connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+                ('format_version', FORMAT_VERSION),
+                ('source_digest', source_digest),
+                ('triple_count', len(rows)),
+            ])
+        connection.executescript(_INDEXES)
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+class SqliteStore(Store):
+    """
+    Read-only store over a database written by write(). Namespace bindings made at runtime are kept in memory only.
+
+    The store holds a single connection shared by all request threads. It stays on the database file it opened even
+    after the background task replaces the file, so a graph version never changes under a request.
+    """
+    context_aware = False
+    formula_aware = False
+    graph_aware = False
+
+    def __init__(self, path, source_digest: bytes = None, cache_kib: int = 16384):
+        super().__init__()
+        self._connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        try:
+            meta = dict(self._connection.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError as e:
+            self._connection.close()
+            raise InvalidStoreFile(f'Not a store database: {e}')
+        if meta.get('format_version') != FORMAT_VERSION:
+            self._connection.close()
+            raise InvalidStoreFile('Unknown store database format')
+        if source_digest is not None and meta.get('source_digest') != source_digest:
+            self._connection.close()
+            raise InvalidStoreFile('Store database is stale')
+
+        self._connection.execute(f'PRAGMA cache_size = -{int(cache_kib)}')
+        self._triple_count = meta['triple_count']
+        self._namespaces = {prefix: URIRef(uri) for prefix, uri in self._connection.execute(
+            'SELECT prefix, uri FROM namespaces')}
+        self._term = lru_cache(maxsize=_TERM_CACHE_SIZE)(decode_term)
+        self._term_id = lru_cache(maxsize=_TERM_CACHE_SIZE)(self._read_term_id)
+
+    def _read_term_id(self, term):
+        """The id of a term, or None if it is not in the store."""
+        try:
+            encoded = encode_term(term)
+        except TypeError:
+            return None
+        row = self._connection.execute('SELECT id FROM terms WHERE term = ?', (encoded,)).fetchone()
+        return row[0] if row else None
+
+    def triples(self, triple_pattern, context=None):
+        conditions = []
+        parameters = []
+        for column, term in zip('spo', triple_pattern):
+            if term is not None:
+                term_id = self._term_id(term)
+                if term_id is None:
+                    return
+                conditions.append(f't.{column} = ?')
+                parameters.append(term_id)
+
+        sql = _SELECT + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+        for s, p, o in self._connection.execute(sql, parameters):
+            yield (self._term(s), self._term(p), self._term(o)), iter(())
+
+    def __len__(self, context=None):
+        return self._triple_count
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError('The SQLite store is read-only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('The SQLite store is read-only')
+
+    def bind(self, prefix, namespace):
+        self._namespaces[prefix] = URIRef(namespace)
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        for prefix, bound in self._namespaces.items():
+            if bound == namespace:
+                return prefix
+        return None
+
+    def namespaces(self):
+        return iter(list(self._namespaces.items()))
+
+
+def open_graph(path: str, source_digest: bytes, cache_kib: int = 16384) -> Graph:
+    if not os.path.isfile(path):
+        raise InvalidStoreFile(f'No store database at path {path}')
+    try:
+        return Graph(store=SqliteStore(path, source_digest, cache_kib))
+    except sqlite3.Error as e:
+        raise InvalidStoreFile(f'Store database could not be read: {e}')
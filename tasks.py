@@ -1,13 +1,22 @@
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from rdflib import Graph
-from owlrl import DeductiveClosure, OWLRL_Semantics
 import yaml
 from celery import Celery
+from celery.signals import worker_ready
 from celery.utils.log import get_task_logger
+from requests.adapters import HTTPAdapter
 from tern_rdf.utils import create_session
 
 from config import Config
+import downloads
+import inference
+import metrics
+import snapshot
+import triplestore
 
 logger = get_task_logger(__name__)
 
@@ -22,27 +31,230 @@ def setup_period_tasks(sender, **kwargs):
     sender.add_periodic_task(float(Config.store_seconds), fetch_data.s(), name='Fetch data')
 
 
+@worker_ready.connect
+def fetch_on_start(sender, **kwargs):
+    # Harvest once when the worker starts rather than waiting for the first periodic run. The web application never
+    # imports this module, so it does not pay for celery or the reasoner.
+    logger.info('Triggering background task on worker start.')
+    sender.app.send_task(fetch_data.name)
+
+
+def _create_pooled_session(pool_size):
+    """A session from tern_rdf with its adapters sized so that every concurrent fetch reuses a pooled connection."""
+    http = create_session()
+    for prefix, adapter in list(http.adapters.items()):
+        http.mount(prefix, HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                       max_retries=adapter.max_retries))
+    return http
+
+
+def _load_state():
+    try:
+        with open(os.path.join(Config.harvest_dir, 'state.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state):
+    snapshot.write_atomic(os.path.join(Config.harvest_dir, 'state.json'), json.dumps(state, indent=2).encode('utf-8'))
+
+
+def _source_cache_path(name):
+    return os.path.join(Config.harvest_dir, f'{name}.snapshot')
+
+
+def _settings():
+    """Settings that change the harvested data or the files written from it without any source changing."""
+    return {'reasoner': Config.reasoner, 'triplestore_type': Config.triplestore_type}
+
+
+def _fetch(http, name, vocab, validators):
+    """
+    Fetch a source, conditionally if validators from the previous harvest are known.
+
+    :return: None if the source is unchanged, otherwise a tuple (content, validators).
+    """
+    start_time = time.time()
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    logger.info(f'Fetching {name} from remote URL {vocab["source"]}')
+    try:
+        r = http.get(vocab['source'], headers=headers, timeout=Config.harvest_timeout)
+        r.raise_for_status()
+    except Exception:
+        metrics.HARVEST_FETCH_SECONDS.observe(time.time() - start_time, source=name, outcome='failed')
+        raise
+    if r.status_code == 304:
+        logger.info(f'{name} not modified, checked in {time.time() - start_time:.2f} seconds')
+        metrics.HARVEST_FETCH_SECONDS.observe(time.time() - start_time, source=name, outcome='not_modified')
+        return None
+    logger.info(f'Fetched {name} with code {r.status_code}: {len(r.content)} bytes in '
+                f'{time.time() - start_time:.2f} seconds')
+
+    new_validators = {
+        'source': vocab['source'],
+        'format': vocab['format'],
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified'),
+        'sha256': snapshot.digest_bytes(r.content).hex(),
+    }
+    if new_validators['sha256'] == validators.get('sha256'):
+        # The server does not support conditional requests but the content is the same.
+        logger.info(f'{name} content unchanged')
+        metrics.HARVEST_FETCH_SECONDS.observe(time.time() - start_time, source=name, outcome='unchanged')
+        return None
+    metrics.HARVEST_FETCH_SECONDS.observe(time.time() - start_time, source=name, outcome='downloaded')
+    return r.content, new_validators
+
+
+def _parse(data, format, cache_path, digest):
+    # Runs in a thread of the parse pool. Celery's prefork pool processes are daemonic and cannot start child processes.
+    g = Graph()
+    g.parse(data=data, format=format)
+    snapshot.write_snapshot(g, cache_path, digest)
+    return g
+
+
+def _cached_validators(state, name, vocab):
+    """The validators of the previous harvest of a source, or an empty dict if they cannot be relied on."""
+    validators = state.get('sources', {}).get(name, {})
+    if validators.get('source') != vocab['source'] or validators.get('format') != vocab['format'] \
+            or not os.path.isfile(_source_cache_path(name)):
+        return {}
+    return validators
+
+
+def harvest(vocabs, state):
+    """
+    Fetch and parse every download source concurrently and merge the results into a single graph.
+
+    Sources that have not changed since the previous harvest are not downloaded or parsed again.
+
+    :return: A tuple (graph, new state), or (None, state) if nothing changed since the previous harvest.
+    """
+    sources = vocabs.get('download') or {}
+    if not sources:
+        return Graph(), {'sources': {}, 'settings': _settings()}
+
+    os.makedirs(Config.harvest_dir, exist_ok=True)
+    validators = {name: _cached_validators(state, name, vocab) for name, vocab in sources.items()}
+    new_state = {'sources': dict(validators), 'settings': _settings()}
+
+    concurrency = max(1, min(Config.harvest_concurrency, len(sources)))
+    http = _create_pooled_session(concurrency)
+    parts = []
+    unchanged = []
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as parse_pool:
+        fetches = {fetch_pool.submit(_fetch, http, name, vocab, validators[name]): (name, vocab)
+                   for name, vocab in sources.items()}
+        parses = {}
+        # Parse each source as soon as it arrives, while slower sources are still downloading.
+        for future in as_completed(fetches):
+            name, vocab = fetches[future]
+            result = future.result()
+            if result is None:
+                unchanged.append(name)
+                continue
+            content, new_state['sources'][name] = result
+            future = parse_pool.submit(_parse, content, vocab['format'], _source_cache_path(name),
+                                       bytes.fromhex(new_state['sources'][name]['sha256']))
+            parses[future] = (name, time.time())
+
+        # A removed source changes the data as well, even though no remaining source changed.
+        if not parses and new_state['settings'] == state.get('settings') \
+                and set(state.get('sources', {})) == set(sources) and os.path.isfile(Config.data_path):
+            return None, state
+
+        for future in as_completed(parses):
+            name, start_time = parses[future]
+            part = future.result()
+            logger.info(f'Parsed {name}: {len(part)} triples in {time.time() - start_time:.2f} seconds')
+            metrics.HARVEST_PARSE_SECONDS.observe(time.time() - start_time, source=name)
+            parts.append(part)
+
+    for name in unchanged:
+        cache_path = _source_cache_path(name)
+        try:
+            part = snapshot.read_snapshot(cache_path, bytes.fromhex(new_state['sources'][name]['sha256']))
+            logger.info(f'Loaded unchanged {name} from cache: {len(part)} triples')
+        except snapshot.InvalidSnapshot as e:
+            logger.warning(f'Cache of {name} not usable, fetching it again. Reason: {e}')
+            content, new_state['sources'][name] = _fetch(http, name, sources[name], {})
+            part = _parse(content, sources[name]['format'], cache_path,
+                          bytes.fromhex(new_state['sources'][name]['sha256']))
+        parts.append(part)
+
+    # Merge into the largest graph to copy as few triples as possible.
+    parts.sort(key=len, reverse=True)
+    g = parts[0]
+    for part in parts[1:]:
+        g += part
+    return g, new_state
+
+
 @app.task
 def fetch_data():
+    try:
+        _fetch_data()
+    finally:
+        # Celery's pool processes do not always run exit handlers.
+        metrics.flush()
+
+
+REASONERS = ('owlrl', 'skos', 'none')
+
+
+def _fetch_data():
+    # Fail before harvesting rather than publish a graph without inference because of a typo.
+    if Config.reasoner not in REASONERS:
+        raise ValueError(f'Unknown reasoner {Config.reasoner!r}, expected one of {", ".join(REASONERS)}')
+
     with open(os.path.join(Config.APP_DIR, Config.VOCAB_SOURCES)) as f:
         vocabs = yaml.safe_load(f)
-        g = Graph()
-        http = create_session()
-        if vocabs.get('download'):
-            for vocab in vocabs['download'].values():
-                logger.info(f'Fetching from remote URL {vocab["source"]}')
-                r = http.get(vocab['source'])
-                r.raise_for_status()
-                data = r.text
-                g.parse(data=data, format=vocab['format'])
-                logger.info(f'Success with code {r.status_code}')
-
-        if Config.reasoner:
+        start_time = time.time()
+        g, state = harvest(vocabs, _load_state())
+        metrics.HARVEST_STAGE_SECONDS.observe(time.time() - start_time, stage='harvest')
+        if g is None:
+            logger.info(f'No source changed, data left as is. Checked in {time.time() - start_time:.2f} seconds')
+            return
+        logger.info(f'Harvested {len(g)} triples in {time.time() - start_time:.2f} seconds')
+
+        start_time = time.time()
+        if Config.reasoner == 'owlrl':
+            from owlrl import DeductiveClosure, OWLRL_Semantics
             DeductiveClosure(OWLRL_Semantics).expand(g)
+        elif Config.reasoner == 'skos':
+            inference.expand(g)
+        metrics.HARVEST_STAGE_SECONDS.observe(time.time() - start_time, stage='reasoner')
+        logger.info(f'Reasoner {Config.reasoner} done in {time.time() - start_time:.2f} seconds, {len(g)} triples')
+
+        start_time = time.time()
+        path = Config.data_path
+        data = g.serialize(format='turtle')
+        digest = snapshot.digest_bytes(data)
+
+        # Write the snapshot before the Turtle file so that it is already valid when the web application reloads.
+        logger.info(f'Writing snapshot to disk at path {Config.snapshot_path}')
+        snapshot.write_snapshot(g, Config.snapshot_path, digest)
+        triplestore.write(g, digest)
+        downloads.write_artifacts(g, digest.hex(), turtle_data=data, formats=['turtle'])
 
-        path = 'data/data.ttl'
         logger.info(f'Serializing to disk at path {path}')
-        g.serialize(path, format='turtle')
+        snapshot.write_atomic(path, data)
+
+        # The remaining formats are served as streamed N-Triples until they are written.
+        downloads.write_artifacts(g, digest.hex())
+        downloads.remove_old_artifacts()
+        metrics.HARVEST_STAGE_SECONDS.observe(time.time() - start_time, stage='write')
+
+        # Only remember the validators once the data they describe has been written.
+        _save_state(state)
 
 
 app.conf.update({
@@ -1,118 +1,73 @@
-# from rdflib import ConjunctiveGraph, Graph, URIRef, Literal
-# from rdflib.namespace import DCTERMS, XSD
-# import yaml
-# from owlrl import DeductiveClosure, OWLRL_Semantics
-# import requests
-#
-# from config import Config
-#
-# import os
-# from datetime import datetime, timedelta
-# import logging
-# import time
-#
-#
-# class InvalidTriplestoreType(Exception):
-#     pass
-#
-#
-# class Triplestore:
-#     THIS_GRAPH = URIRef('http://www.this-graph.com/123456789/')
-#     loading = False
-#
-#     @staticmethod
-#     def get_db(triplestore_type):
-#         if triplestore_type == 'memory':
-#             if not hasattr(Config, 'g'):
-#                 # g = Triplestore._create_db()
-#                 g = Graph()
-#             else:
-#                 g = Config.g
-#                 # for date in g.objects(Triplestore.THIS_GRAPH, DCTERMS.created):
-#                 #     now = datetime.now()
-#                 #     now -= timedelta(hours=Config.store_hours, minutes=Config.store_minutes)
-#                 #     if now > date.toPython():
-#                 #         g = Triplestore._create_db(g)
-#         else:
-#             raise InvalidTriplestoreType(
-#                 'Expected one of: [memory]. Instead got {}'.format(triplestore_type))
-#         return g
-#
-#     @staticmethod
-#     def _create_db(old_g: Graph = None):
-#         start_time = time.time()
-#
-#         g = ConjunctiveGraph()
-#
-#         if not Triplestore.loading:
-#             logging.info('Creating new graph')
-#             Triplestore.loading = True
-#             Triplestore._add_triples(g)
-#
-#             # Add time of creation of new Graph
-#             g.add((Triplestore.THIS_GRAPH, DCTERMS.created, Literal(datetime.now(), datatype=XSD.dateTime)))
-#
-#             logging.info(f'time taken: {(time.time() - start_time):.2f} seconds')
-#             Triplestore.loading = False
-#         else:
-#             if old_g:
-#                 return old_g
-#
-#         return g
-#
-#     @staticmethod
-#     def _add_triples(g):
-#         # Read in RDF from online sources to the Graph.
-#         logging.info('Pulling RDF triples from remote resources.')
-#         with open(os.path.join(Config.APP_DIR, Config.VOCAB_SOURCES)) as f:
-#             vocabs = yaml.safe_load(f)
-#
-#             # Online resources
-#             if vocabs.get('download'):
-#                 for vocab in vocabs['download'].values():
-#                     r = requests.get(vocab['source'])
-#                     data = r.content.decode('utf-8')
-#                     g.parse(format=vocab['format'], data=data)
-#
-#             # Local resources
-#             if vocabs.get('local'):
-#                 for vocab in vocabs['local'].values():
-#                     g: Graph
-#                     g.parse(os.path.join(Config.APP_DIR, 'local_vocabs', vocab['source']), format=vocab['format'])
-#
-#             # SPARQL resources
-#             pass
-#
-#             # RVA
-#             resource_endpoint = vocabs['rva']['resource_endpoint']
-#             download_endpoint = vocabs['rva']['download_endpoint']
-#             extension = vocabs['rva']['extension']
-#             format = vocabs['rva']['format']
-#             for id in vocabs['rva']['ids']:
-#                 r = requests.get(resource_endpoint.format(id), headers={'accept': 'application/json'})
-#                 try:
-#                     response = r.json()
-#                     versions = response['version']
-#                     download_id = None
-#                     for version in versions:
-#                         if version['status'] == 'current':
-#                             access_points = version['access-point']
-#                             for access_point in access_points:
-#                                 if access_point.get('ap-sesame-download'):
-#                                     download_id = access_point['id']
-#
-#                             if download_id is None:
-#                                 # Sesame endpoing not found, go for the Turtle file
-#                                 for access_point in access_points:
-#                                     if access_point.get('ap-file'):
-#                                         g.parse(access_point['ap-file']['url'], format='turtle')
-#
-#                     if download_id:
-#                         r = requests.get(download_endpoint.format(download_id), params={'format': extension})
-#                         g.parse(data=r.content.decode('utf-8'), format=format)
-#                 except Exception as e:
-#                     raise Exception('Something wrong with the response of RVA ID {}. Error: {}'.format(id, e))
-#
-#             # Expand graph using a rule-based inferencer.
-#             if Config.reasoner:
-#                 DeductiveClosure(OWLRL_Semantics).expand(g)
+"""
+Backends of the graph the web application reads, selected by Config.triplestore_type.
+
+The memory (and pickle) backends load the whole graph into each worker, from the snapshot or the Turtle file. The disk
+backends are written by the background task next to the Turtle file and opened read-only by each worker.
+"""
+import logging
+
+from rdflib import Graph
+
+from config import Config
+import mmap_store
+import sqlite_store
+
+logger = logging.getLogger(__name__)
+
+IN_MEMORY = ('memory', 'pickle')
+DISK_STORES = {
+    'mmap': mmap_store,
+    'sqlite': sqlite_store,
+}
+
+
+class InvalidTriplestoreType(Exception):
+    pass
+
+
+def _disk_store():
+    """The module of the configured disk backend, or None for an in-memory graph."""
+    triplestore_type = Config.triplestore_type
+    if triplestore_type in IN_MEMORY:
+        return None
+    if triplestore_type not in DISK_STORES:
+        raise InvalidTriplestoreType('Expected one of: {}. Instead got {}'.format(
+            ', '.join(IN_MEMORY + tuple(DISK_STORES)), triplestore_type))
+    return DISK_STORES[triplestore_type]
+
+
+def _path(store):
+    return Config.mmap_path if store is mmap_store else Config.sqlite_path
+
+
+def write(g: Graph, source_digest: bytes):
+    """Write the graph for the configured disk backend. Does nothing for an in-memory graph."""
+    store = _disk_store()
+    if store is None:
+        return
+    logger.info(f'Writing {Config.triplestore_type} store to disk at path {_path(store)}')
+    store.write(g, _path(store), source_digest)
+
+
+def open_graph(source_digest: bytes):
+    """
+    Open the configured disk backend written from the data file with the given digest.
+
+    :return: The graph, or None for an in-memory graph or if the store is missing or stale.
+    """
+    store = _disk_store()
+    if store is None:
+        return None
+    path = _path(store)
+    try:
+        if store is sqlite_store:
+            g = store.open_graph(path, source_digest, Config.sqlite_cache_kib)
+        else:
+            g = store.open_graph(path, source_digest)
+        logger.info(f'Opened {Config.triplestore_type} store at path {path}')
+        return g
+    except store.InvalidStoreFile as e:
+        logger.info(f'{Config.triplestore_type} store not used, falling back to snapshot. Reason: {e}')
+    except OSError as e:
+        logger.warning(f'Could not open {Config.triplestore_type} store at path {path}: {e}')
+    return None